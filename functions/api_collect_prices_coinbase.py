@@ -9,146 +9,154 @@ https://docs.pro.coinbase.com/#get-historic-rates
 
 import os
 import json
-import time
+import threading
 import pandas as pd
 from datetime import datetime
 from pprint import pprint
+from concurrent.futures import ThreadPoolExecutor
 import cbpro
 from db_connect import db_connect
+from rate_limiter import TokenBucket
+from collection_plan import collection_plan
+from db_migrate import db_migrate
+from ingest_candles import upsert_candles
 
 # Load the platform configuration
 os.chdir(os.path.dirname(os.path.realpath(__file__)))
 with open('../config.json') as f:
     config = json.load(f)
 
-print("[INFO] Establishing the Coinbase API connection")
-public_client = cbpro.PublicClient()
-
+# The API address and database can be overridden to collect from a local stub server
+# All API calls share one token bucket to respect the published rate limits
+API_URL = os.environ.get('COINBASE_API_URL', config['COINBASE_API_URL'])
+DB_FILE = os.environ.get('COLLECTOR_DB_FILE', config['COLLECTOR_DB_FILE'])
+N_WORKERS = int(config['COLLECTOR_WORKERS'])
+rate_limiter = TokenBucket(float(config['COINBASE_REQUESTS_PER_SECOND']), float(config['COINBASE_REQUESTS_BURST']))
+api_clients = threading.local()
 START_DT_UTC = '2019-01-01 00:00:00'
-NOW_DT_UTC = datetime.utcnow().strftime('%Y-%m-%d')
-
-# Connect to the Coinbase API
-# API Docs: https://docs.pro.coinbase.com/
-# Manage API Keys and Secrets: https://pro.coinbase.com/profile/api
-products = public_client.get_products()
+BATCH_DATES = 30
 
-## DEVELOPMENT ONLY
-## import os
-## os.chdir('/home/dale/Downloads/GitHub/TwentyFourCoins/functions')
+def public_client():
+    '''Return the Coinbase API client for the current thread
+    '''
+    if not hasattr(api_clients, 'client'):
+        api_clients.client = cbpro.PublicClient(api_url=API_URL)
+    return api_clients.client
 
-# Consider all supported coins
-for COIN_NAME, COIN in config['SUPPORTED_COINS'].items():
+def fetch_candles(COIN, d):
+    '''Collect the five minute candles for a coin on one UTC date
     
-    ## DEVELOPMENT ONLY
-    ## COIN = 'BAT-USDC'
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param str d: UTC date in the format YYYY-MM-DD
+    '''
+    d_start = d + ' 00:05:00'
+    d_end = d + ' 23:55:00'
     
-    # Print the product details in the JSON format
-    print("[INFO] Starting the iteration for " + COIN)
+    # Collect the historical prices in five minute intervals
+    # Keep the timestamp and closing price
+    rate_limiter.acquire()
+    hist = public_client().get_product_historic_rates(COIN, start=d_start, end=d_end, granularity=300)
+    hist = pd.DataFrame(hist, columns=['time','low','high','open','close','volume'])[['time','close']]
+    hist.columns = ['time','price']
+    hist.insert(loc=0, column='coin', value=COIN)
+    
+    # Keep the unix epoch time stamps as integer seconds
+    hist['time'] = hist['time'].astype('int64')
+    return hist
+
+def main():
+    '''Collect the missing and incomplete days of candles for all supported coins
+    '''
+    print("[INFO] Establishing the Coinbase API connection")
+    NOW_DT_UTC = datetime.utcnow().strftime('%Y-%m-%d')
     
-    details = [x for x in products if x['id']==COIN]
-    assert len(details)>0, '[ERROR] Coin unidentified by Coinbase API'
-    details = details[0]
-    pprint(details)
+    # Connect to the Coinbase API
+    # API Docs: https://docs.pro.coinbase.com/
+    # Manage API Keys and Secrets: https://pro.coinbase.com/profile/api
+    rate_limiter.acquire()
+    products = public_client().get_products()
     
-    # Retreive the existing data for the coin
-    con = db_connect('../data/db.sqlite')
-    statement = 'SELECT * FROM prices_coinbase WHERE coin = "%s"' % (COIN)
-    df = pd.read_sql(statement, con)
-    df['time'] = pd.to_datetime(df['time'])
+    ## DEVELOPMENT ONLY
+    ## import os
+    ## os.chdir('/home/dale/Downloads/GitHub/TwentyFourCoins/functions')
     
-    # Create a list of possible dates between the specific range
-    datelist = pd.date_range(START_DT_UTC, NOW_DT_UTC).tolist()
-    datelist = [x.strftime('%Y-%m-%d') for x in datelist]
-    if len(df) > 0:
+    # Plan the dates to collect for all supported coins
+    con = db_connect(DB_FILE)
+    db_migrate(con)
+    coin_dates = {}
+    for COIN_NAME, COIN in config['SUPPORTED_COINS'].items():
         
-        # Data cleansing and validation
-        # Purge data for dates with incomplete, excessive, or duplicate records
-        df['UTC_DAY'] = df['time'].dt.strftime('%Y-%m-%d')
-        day_counts = df['UTC_DAY'].value_counts()
-        day_counts = day_counts[(day_counts<200) | (day_counts > 300)]
-        day_list = day_counts.index.values.tolist()
+        ## DEVELOPMENT ONLY
+        ## COIN = 'BAT-USDC'
         
-        dups = df[df['time'].duplicated()]['UTC_DAY'].unique().tolist()
-        [day_list.append(d) for d in dups]
-        day_list = set(day_list)
+        # Print the product details in the JSON format
+        print("[INFO] Starting the iteration for " + COIN)
         
-        N_PURGE = len(day_list)
-        print('[INFO] Purging existing prices for', str(N_PURGE), 'days')
+        details = [x for x in products if x['id']==COIN]
+        assert len(details)>0, '[ERROR] Coin unidentified by Coinbase API'
+        details = details[0]
+        pprint(details)
         
-        # Delete the bad price records in the database
-        # Concatenate timestamp strings
-        time_purge = df.loc[df['UTC_DAY'].isin(day_list)]['time'].astype(str).to_list()
-        if len(time_purge) > 0:
-            if len(time_purge) == 1:
-                time_purge = "('" + str(time_purge[0]) + "')"
-            else:
-                time_purge = tuple(time_purge)
-            statement = 'DELETE FROM prices_coinbase WHERE coin = "%s" AND time IN %s' % (COIN, time_purge)
-            cursor = con.cursor()
-            cursor.execute(statement)
-            cursor.close()
-            con.commit()
+        # Data cleansing and validation
+        # Refetch dates with incomplete, excessive, or duplicate records
+        day_list, datelist = collection_plan(con, COIN, START_DT_UTC, NOW_DT_UTC)
+        print('[INFO] Replacing existing prices for', str(len(day_list)), 'days')
         
-        # Identify existing UTC dates with good data
-        # Recalculate prices for the current date to avoid intra-day gaps
-        df = df[~df['UTC_DAY'].isin(day_list)]
-        df = df.loc[df['UTC_DAY'] < datetime.utcnow().strftime('%Y-%m-%d')]
-        exist_dates = set(df['UTC_DAY'])
-        del df['UTC_DAY']
-        datelist = [x for x in datelist if x not in exist_dates]
+        coin_dates[COIN] = datelist
     
-    # Iterate over the dates to collect new candles using the Coinbase API
-    # Iteratively save the data after 10 dates have passed
+    # Collect new candles using the Coinbase API across coins and dates in parallel
+    # Save the candles for each coin in date order from the main thread
+    # Upsert the candles in one transaction after every batch of dates
+    executor = ThreadPoolExecutor(max_workers=N_WORKERS)
+    candles = []
     try:
         
-        print('[INFO] Starting the API iterations with', len(datelist), 'total dates')
-        DATE_COUNTER = 0
-        N_DATES = len(datelist)
-        N_INCOMPLETE = 0
-        for d in datelist:
-            
-            d_start = d + ' 00:05:00'
-            d_end = d + ' 23:55:00'
-            
-            # Collect the historical prices in five minute intervals
-            # Keep the timestamp and closing price
-            hist = public_client.get_product_historic_rates(COIN, start=d_start, end=d_end, granularity=300)
-            hist = pd.DataFrame(hist).iloc[:,[0,4]]
-            hist.columns = df.columns[1:]
-            hist.insert(loc=0, column='coin', value=COIN)
-            N_HIST = len(hist)
-            print('[INFO] Gathered', N_HIST, 'new price candles for', d)
+        coin_futures = {COIN:[(d, executor.submit(fetch_candles, COIN, d)) for d in datelist]
+                        for COIN, datelist in coin_dates.items()}
+        for COIN, futures in coin_futures.items():
             
-            # Convert unix epoch time stamps to UTC datetime
-            hist['time'] = pd.to_datetime(hist['time'], unit='s', utc=True)
-            hist['time'] = hist['time'].dt.strftime('%Y-%m-%d %H:%M:%S')
-            hist['time'] = pd.to_datetime(hist['time'])
-            
-            # Monitor the API calls for empty responses
-            # Stop if five consecutive empty responses are observed
-            N_INCOMPLETE = N_INCOMPLETE+1 if N_HIST == 0 else 0
-            assert N_INCOMPLETE < 5, '[ERROR] Five consecutive empty API responses'
-            
-            # Save the new candles to the database
-            hist.to_sql('prices_coinbase', con, if_exists='append', index=False)
-            
-            # Sleep for one second to respect the API limits and avoid errors
-            time.sleep(1)
-            
-            DATE_COUNTER += 1
-            if DATE_COUNTER % 10 == 0 or DATE_COUNTER == N_DATES:
+            print('[INFO] Starting the API iterations for', COIN, 'with', len(futures), 'total dates')
+            DATE_COUNTER = 0
+            N_DATES = len(futures)
+            N_INCOMPLETE = 0
+            candles = []
+            for d, future in futures:
+                
+                hist = future.result()
+                N_HIST = len(hist)
+                print('[INFO] Gathered', N_HIST, 'new price candles for', d)
                 
-                cmp_pct = '{:.1%}'.format(DATE_COUNTER/N_DATES)
-                print('[INFO]', cmp_pct, 'finished with the iterations for', COIN)
+                # Monitor the API calls for empty responses
+                # Stop if five consecutive empty responses are observed
+                N_INCOMPLETE = N_INCOMPLETE+1 if N_HIST == 0 else 0
+                assert N_INCOMPLETE < 5, '[ERROR] Five consecutive empty API responses'
+                
+                # Save the new candles to the database
+                candles.extend(hist.itertuples(index=False, name=None))
+                DATE_COUNTER += 1
+                if DATE_COUNTER % BATCH_DATES == 0 or DATE_COUNTER == N_DATES:
+                    
+                    upsert_candles(con, candles)
+                    candles = []
+                    cmp_pct = '{:.1%}'.format(DATE_COUNTER/N_DATES)
+                    print('[INFO]', cmp_pct, 'finished with the iterations for', COIN)
     
     except KeyboardInterrupt:
         
         print("[INFO] Acknowledged the KeyboardInterrupt")
         print("[INFO] Shutting down the process")
-        con.commit()
-        con.close()
+    
+    finally:
+        
+        # Stop the pending API calls if the collection ended early
+        # Save the candles already collected in the unfinished batch
+        executor.shutdown(wait=True, cancel_futures=True)
+        if len(candles) > 0:
+            upsert_candles(con, candles)
+    
+    # Close the database connection
+    con.close()
+    print('[FINISHED] Successfully collected historical prices')
 
-# Close the database connection
-con.commit()
-con.close()
-print('[FINISHED] Successfully collected historical prices')
+if __name__ == '__main__':
+    main()
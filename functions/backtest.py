@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Walk-forward (rolling origin) backtests of the models and ensembles.
+
+The features of a coin are built once and every fold is a range of rows of
+the same matrix, sorted from oldest to newest. Each fold trains on all rows
+before its test block, leaving a gap of one time window so no training
+target overlaps the test block. The seven base and ensemble strategies are
+evaluated together by multiplying the base model predictions with a weight
+matrix. The folds run in forked worker processes, which inherit the feature
+matrix instead of receiving a pickled copy.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+from training_data import training_rows, training_matrix, feature_columns
+from feature_store import feature_store_open
+from moving_averages import moving_average_search_windows, moving_average_search, moving_averages_at
+from feature_selection import select_features
+from model_training import base_models, training_threads
+
+# Weights of the random forest, moving average, and linear regression predictions
+STRATEGIES = ['RangerForestRegressor', 'MovingAverage', 'LinearRegression',
+              'Ensemble_ALL', 'Ensemble_RF_AVG', 'Ensemble_RF_LR', 'Ensemble_AVG_LR']
+STRATEGY_WEIGHTS = np.array([
+        [1, 0, 0, 1/3, 1/2, 1/2, 0],
+        [0, 1, 0, 1/3, 1/2, 0, 1/2],
+        [0, 0, 1, 1/3, 0, 1/2, 1/2],
+        ])
+
+# Feature matrix of the running backtest, inherited by the forked workers
+backtest_inputs = {}
+
+def backtest_folds(N, WINDOW, N_FOLDS, TEST_ROWS):
+    '''Split the rows into expanding training ranges and consecutive test blocks
+
+    Returns (train_end, test_start, test_end) row ranges for the last
+    N_FOLDS blocks of TEST_ROWS rows.
+
+    ::param int N: number of rows, sorted from oldest to newest
+    ::param int WINDOW: time window in five minute bundles
+    ::param int N_FOLDS: number of folds
+    ::param int TEST_ROWS: rows in each test block
+    '''
+    folds = []
+    for k in range(N_FOLDS):
+        test_start = N - (N_FOLDS-k)*TEST_ROWS
+        train_end = test_start - WINDOW
+        assert train_end >= TEST_ROWS, '[ERROR] Not enough history for ' + str(N_FOLDS) + ' backtest folds'
+        folds.append((train_end, test_start, test_start + TEST_ROWS))
+    return folds
+
+def backtest_fold(fold, n_jobs):
+    '''Train and evaluate every strategy for one fold
+
+    The moving average window is chosen on the last training rows, whose
+    targets are known before the test block starts.
+
+    ::param tuple fold: (train_end, test_start, test_end) row ranges
+    ::param int n_jobs: threads for the random forest and linear algebra
+    '''
+    train_end, test_start, test_end = fold
+    x, y = backtest_inputs['x'], backtest_inputs['y']
+    positions, prices = backtest_inputs['positions'], backtest_inputs['prices']
+    TEST_ROWS = test_end - test_start
+    
+    # Select the features on the training rows, as in training
+    columns = select_features(x[:train_end], backtest_inputs['threshold'])
+    x_train, x_test = x[:train_end, columns], x[test_start:test_end, columns]
+    
+    with threadpool_limits(limits=n_jobs):
+        rfr, lr = base_models(n_jobs)
+        rfr.fit(x_train, y[:train_end])
+        lr.fit(x_train, y[:train_end])
+        rf_preds = rfr.predict(x_test)
+        lr_preds = lr.predict(x_test)
+    
+    windows = backtest_inputs['windows']
+    search_rows = positions[train_end-TEST_ROWS:train_end]
+    avgs_mae = moving_average_search(prices, search_rows, y[train_end-TEST_ROWS:train_end], windows)
+    best_mov_avg = windows[int(np.argmin(avgs_mae))]
+    mov_avg = moving_averages_at(prices, positions[test_start:test_end], [best_mov_avg])[:, 0]
+    
+    # Evaluate the seven strategies in one pass
+    preds = np.column_stack([rf_preds, mov_avg, lr_preds]) @ STRATEGY_WEIGHTS
+    y_test = y[test_start:test_end, None]
+    MAE = np.abs(preds - y_test).mean(axis=0)
+    MAPE = np.abs((preds - y_test)/y_test).mean(axis=0)
+    return best_mov_avg, MAE, MAPE
+
+def backtest(con, config, COIN, WINDOW, prices_spy, prices_btc, N_WORKERS):
+    '''Run a walk-forward backtest for a coin and time window
+
+    Returns one row per fold and strategy with the test period, the number
+    of training rows, the moving average window, the MAE, and the MAPE.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param DataFrame prices_spy: SPY features by day from features_stock_spy
+    ::param DataFrame prices_btc: BTC features by day from features_bitcoin
+    ::param int N_WORKERS: number of folds trained at the same time
+    '''
+    print('[INFO] Starting the backtest for', COIN)
+    print('[INFO] Time window (5 minute bundles) =', WINDOW)
+    
+    # Build the features once, sorted from oldest to newest
+    # Keep the most recent rows that fit in the training memory budget
+    columns = feature_columns(config, COIN)
+    M = training_rows(config, COIN, WINDOW)
+    N_ROWS = min(M, int(config['TRAINING_MEMORY_MB'])*2**20 // (4*len(columns) + 16))
+    positions = np.arange(M-N_ROWS, M)
+    x, y = training_matrix(config, COIN, WINDOW, prices_spy, prices_btc, columns, positions)
+    store = feature_store_open(config, COIN)
+    backtest_inputs.update(
+            x=x, y=y, positions=positions, prices=store['price'],
+            windows=moving_average_search_windows(config),
+            threshold=float(config['FEATURE_CORRELATION_THRESHOLD']),
+            )
+    
+    folds = backtest_folds(N_ROWS, WINDOW, int(config['BACKTEST_FOLDS']), int(config['BACKTEST_TEST_ROWS']))
+    N_WORKERS = max(1, min(N_WORKERS, len(folds)))
+    N_JOBS = training_threads(N_WORKERS)
+    print('[INFO] Backtesting', len(folds), 'folds with', N_WORKERS, 'workers and', N_JOBS, 'threads each')
+    try:
+        
+        if N_WORKERS == 1:
+            results = [backtest_fold(fold, N_JOBS) for fold in folds]
+        else:
+            with ProcessPoolExecutor(max_workers=N_WORKERS, mp_context=multiprocessing.get_context('fork')) as executor:
+                results = list(executor.map(backtest_fold, folds, [N_JOBS]*len(folds)))
+    
+    finally:
+        backtest_inputs.clear()
+    
+    rows = []
+    for (train_end, test_start, test_end), (best_mov_avg, MAE, MAPE) in zip(folds, results):
+        for j, strategy in enumerate(STRATEGIES):
+            rows.append({
+                    'coin':COIN,
+                    'window':WINDOW,
+                    'test_start':int(store['time'][positions[test_start]]),
+                    'test_end':int(store['time'][positions[test_end-1]]),
+                    'train_rows':train_end,
+                    'mov_avg_window':best_mov_avg,
+                    'strategy':strategy,
+                    'MAE':MAE[j],
+                    'MAPE':MAPE[j],
+                    })
+    
+    return pd.DataFrame(rows)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run walk-forward backtests for all supported coins and time windows.
+
+The results of every fold and strategy are saved to
+data/backtests/backtest-<COIN>-<WINDOW>.csv, and the average error of each
+strategy across the folds is printed.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import json
+
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+from db_connect import db_connect
+from feature_store import feature_store_sync
+from backtest import backtest
+con = db_connect('../data/db.sqlite')
+
+# Load the configurations
+with open('../config.json') as f:
+    config = json.load(f)
+
+# Load the historical prices for important features
+from features.stock_spy import features_stock_spy
+from features.bitcoin import features_bitcoin
+prices_spy = features_stock_spy(con, config)
+prices_btc = features_bitcoin(con)
+
+BACKTEST_DIR = '../data/backtests'
+os.makedirs(BACKTEST_DIR, exist_ok=True)
+
+for COIN in config['SUPPORTED_COINS'].values():
+    
+    feature_store_sync(con, config, COIN)
+    for w in config['SUPPORTED_WINDOWS']:
+        
+        results = backtest(con, config, COIN, int(w), prices_spy, prices_btc, int(config['TRAINING_WORKERS']))
+        results.to_csv(BACKTEST_DIR + '/backtest-' + COIN + '-' + w + '.csv', index=False)
+        
+        summary = results.groupby('strategy')[['MAE', 'MAPE']].mean().sort_values('MAE')
+        print('[INFO] Average backtest error for', COIN, w, 'across', results['test_start'].nunique(), 'folds')
+        for strategy, row in summary.iterrows():
+            print('[INFO]', strategy, 'MAE =', '${:,.6f}'.format(row['MAE']), 'MAPE =', '{:.2%}'.format(row['MAPE']))
+
+# Close the database connection
+con.close()
+print('[INFO] Finished the backtests')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the load time of the registered model artifacts against the
+earlier bz2 compressed cPickle format of the same model objects.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import json
+import time
+import tempfile
+import bz2
+import _pickle as cPickle
+
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+from db_connect import db_connect
+from model_registry import latest_model, load_models, artifact_path
+con = db_connect('../data/db.sqlite')
+
+# Load the configurations
+with open('../config.json') as f:
+    config = json.load(f)
+
+N_REPEAT = 5
+
+def best_load_time(load):
+    '''Return the fastest of N_REPEAT load times in seconds
+    '''
+    times = []
+    for i in range(N_REPEAT):
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+for COIN in config['SUPPORTED_COINS'].values():
+    for w in config['SUPPORTED_WINDOWS']:
+        
+        entry = latest_model(con, COIN, int(w))
+        if entry is None:
+            print('[INFO] No registered models for', COIN, w)
+            continue
+        
+        # Write the same model objects in the earlier bz2 format
+        models = load_models(entry)
+        with tempfile.TemporaryDirectory() as tmp:
+            BZ2_FILE = os.path.join(tmp, 'models.pkl')
+            with bz2.BZ2File(BZ2_FILE, 'wb') as f:
+                cPickle.dump([models['rfr'], models['lr'], models['best_model'], models['mov_avg_col']], f)
+            
+            def load_bz2():
+                with bz2.BZ2File(BZ2_FILE, 'rb') as f:
+                    return cPickle.load(f)
+            
+            ARTIFACT_SIZE = os.path.getsize(artifact_path(entry['ARTIFACT']))
+            BZ2_SIZE = os.path.getsize(BZ2_FILE)
+            ARTIFACT_TIME = best_load_time(lambda: load_models(entry))
+            BZ2_TIME = best_load_time(load_bz2)
+        
+        print('[INFO]', COIN, w, 'artifact {:.3f}s ({:,} bytes), bz2 {:.3f}s ({:,} bytes), {:.1f}x faster'.format(
+                ARTIFACT_TIME, ARTIFACT_SIZE, BZ2_TIME, BZ2_SIZE, BZ2_TIME / ARTIFACT_TIME))
+
+con.close()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Build the Bokeh chart documents for the predictive performance charts.
+
+The charts are built once per prediction run and embedded in the web
+application with Bokeh.embed.embed_item. Panning and zooming calls
+loadChartDetail() in static/js/index.js to fetch finer detail for the
+visible time range.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+from bokeh.plotting import figure
+from bokeh.embed import json_item
+from bokeh.models import NumeralTickFormatter, Legend, HoverTool, Range1d, CustomJS
+
+CHART_WIDTH = 475
+
+def chart_item(COIN, WINDOW, actuals_time, actuals_price, preds_time, preds_price, target='mainChart'):
+    '''Build the serialized chart with the actual and predicted prices
+
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param array actuals_time: epoch seconds of the actual prices
+    ::param array actuals_price: actual prices
+    ::param array preds_time: epoch seconds of the predicted prices
+    ::param array preds_price: predicted prices
+    ::param str target: id of the HTML element for the chart
+    '''
+    actuals_time = np.asarray(actuals_time, dtype='int64').astype('datetime64[s]')
+    preds_time = np.asarray(preds_time, dtype='int64').astype('datetime64[s]')
+    actuals_price = np.asarray(actuals_price, dtype='float32')
+    preds_price = np.asarray(preds_price, dtype='float32')
+    
+    # Define the chart figure
+    # The fixed time range only changes through panning and zooming
+    x_range = Range1d(min(actuals_time.min(), preds_time.min()), max(actuals_time.max(), preds_time.max()))
+    fig = figure(x_axis_type='datetime', x_range=x_range, tools="pan,box_select,reset,wheel_zoom", active_drag="pan")
+    fig.add_layout(Legend(location=(50, 0), orientation="horizontal"), "above")
+    actuals = fig.line(actuals_time, actuals_price, color='#4488EE', line_width=2, legend_label='Actuals', name="Actuals")
+    preds = fig.line(preds_time, preds_price, color='black', line_width=2, legend_label='Predictions', name="Predictions")
+    fig.width = CHART_WIDTH
+    fig.height = 300
+    fig.toolbar.logo = None
+    fig.background_fill_color = None
+    fig.border_fill_color = None
+    fig.legend.background_fill_color = None
+    fig.legend.border_line_color = None
+    fig.legend.padding = 0
+    fig.legend.margin = 0
+    fig.legend.spacing = 10
+    fig.legend.label_text_font_size = '16pt'
+    fig.legend.label_text_font = 'Calibri'
+    fig.legend.label_text_color = 'black'
+    fig.yaxis[0].formatter = NumeralTickFormatter(format="$0,.00")
+    hover = HoverTool(tooltips=[("Line", "$name"),("Date", "$x{%F %T %Z}"),("Price", "$y{$0.0000}")], formatters={"$x": 'datetime'})
+    fig.add_tools(hover)
+    
+    # Load the detail for the visible time range after panning and zooming
+    callback = CustomJS(args=dict(actuals=actuals.data_source, predictions=preds.data_source),
+                        code='loadChartDetail("%s", "%s", cb_obj, %d, actuals, predictions);' % (COIN, WINDOW, CHART_WIDTH))
+    x_range.js_on_change('start', callback)
+    x_range.js_on_change('end', callback)
+    
+    return json_item(fig, target)
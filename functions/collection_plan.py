@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Plan the UTC dates to collect for a coin with aggregate queries in SQLite,
+without loading the stored price history into memory.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+# Candle counts per UTC day for a coin, with the number of distinct timestamps
+# to identify days with duplicate records
+# Days are numbered by integer division of the epoch seconds
+DAY_COUNTS = '''
+SELECT time / 86400 AS day, COUNT(*) AS n, COUNT(DISTINCT time) AS n_distinct
+FROM prices_coinbase WHERE coin = ? GROUP BY day
+'''
+
+# Days with incomplete, excessive, or duplicate records
+BAD_DAYS = '''
+SELECT date(day * 86400, 'unixepoch') FROM (%s)
+WHERE n < 200 OR n > 300 OR n != n_distinct ORDER BY day
+''' % DAY_COUNTS
+
+# Every date in the collection range without good data, plus the current date
+FETCH_DAYS = '''
+WITH RECURSIVE calendar(day) AS (
+    SELECT CAST(strftime('%%s', ?) AS INTEGER) / 86400
+    UNION ALL SELECT day + 1 FROM calendar WHERE day < CAST(strftime('%%s', ?) AS INTEGER) / 86400
+),
+good_days AS (
+    SELECT day FROM (%s) WHERE n BETWEEN 200 AND 300 AND n = n_distinct
+)
+SELECT date(day * 86400, 'unixepoch') FROM calendar
+WHERE day NOT IN (SELECT day FROM good_days) OR day >= CAST(strftime('%%s', ?) AS INTEGER) / 86400
+ORDER BY day
+''' % DAY_COUNTS
+
+def collection_plan(con, COIN, START_DT_UTC, NOW_DT_UTC):
+    '''Identify the UTC dates to (re)collect for a coin
+
+    Returns the list of dates with bad data and the list of dates to collect,
+    both formatted as YYYY-MM-DD. Dates to collect include the missing dates,
+    the dates with bad data, and the current date to avoid intra-day gaps.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param str START_DT_UTC: first date of the collection range
+    ::param str NOW_DT_UTC: current UTC date
+    '''
+    cursor = con.cursor()
+    cursor.execute(BAD_DAYS, (COIN,))
+    bad_days = [r[0] for r in cursor.fetchall()]
+
+    cursor.execute(FETCH_DAYS, (START_DT_UTC, NOW_DT_UTC, COIN, NOW_DT_UTC))
+    fetch_days = [r[0] for r in cursor.fetchall()]
+    cursor.close()
+
+    return bad_days, fetch_days
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Daily aggregates of the price candles, materialized in the daily_prices table.
+
+The aggregates of a coin and UTC day are recomputed from its candles whenever
+candles of that day are ingested, so the daily features are read with one
+indexed query instead of grouping the whole price history.
+
+Each aggregate is a column of daily_prices with its type and a SQL expression
+over the candles of one coin and day in DAILY_AGGREGATES. Migration 8 created
+the table with the initial aggregates as literal SQL. A new aggregate needs its
+entry here and a new migration that calls rebuild_daily_prices, which rebuilds
+the table with every current aggregate.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+# Column types and SQL expressions over the candles c of one coin and UTC day
+# The open and close prices are looked up by the first and last time of the day
+DAY_START = 'c.time / 86400 * 86400'
+DAILY_AGGREGATES = {
+    'open_price':('FLOAT', '(SELECT p.price FROM prices_coinbase AS p WHERE p.coin = c.coin AND p.time >= %s \
+    ORDER BY p.time LIMIT 1)' % DAY_START),
+    'close_price':('FLOAT', '(SELECT p.price FROM prices_coinbase AS p WHERE p.coin = c.coin AND p.time < %s + 86400 \
+    ORDER BY p.time DESC LIMIT 1)' % DAY_START),
+    'max_price':('FLOAT', 'MAX(c.price)'),
+    'min_price':('FLOAT', 'MIN(c.price)'),
+    'n_candles':('INT', 'COUNT(*)'),
+    }
+
+AGGREGATE_COLUMNS = ', '.join(DAILY_AGGREGATES)
+AGGREGATE_EXPRESSIONS = ', '.join(expr for TYPE, expr in DAILY_AGGREGATES.values())
+REFRESH_DAY = '''
+INSERT OR REPLACE INTO daily_prices (coin, day, %s)
+SELECT c.coin, %s AS day, %s FROM prices_coinbase AS c
+WHERE c.coin = ? AND c.time >= ? AND c.time < ? GROUP BY c.coin, day
+''' % (AGGREGATE_COLUMNS, DAY_START, AGGREGATE_EXPRESSIONS)
+
+def rebuild_daily_prices():
+    '''Statements of a migration that rebuilds daily_prices from the candles
+
+    The table is created with every aggregate in DAILY_AGGREGATES and seeded
+    with the aggregates of every stored coin and day.
+    '''
+    columns = ', '.join('%s %s NOT NULL' % (name, TYPE) for name, (TYPE, expr) in DAILY_AGGREGATES.items())
+    return [
+        'DROP TABLE IF EXISTS daily_prices',
+        'CREATE TABLE daily_prices (coin TEXT NOT NULL, day INTEGER NOT NULL, %s, \
+        PRIMARY KEY (coin, day)) WITHOUT ROWID' % columns,
+        'INSERT INTO daily_prices (coin, day, %s) SELECT c.coin, %s AS day, %s \
+        FROM prices_coinbase AS c GROUP BY c.coin, day' % (AGGREGATE_COLUMNS, DAY_START, AGGREGATE_EXPRESSIONS),
+        ]
+
+def refresh_daily_prices(cursor, days):
+    '''Recompute the daily aggregates of a set of coins and UTC days
+
+    Runs within the transaction of the cursor, after the candles of the days
+    were replaced, so the aggregates are committed together with the candles.
+
+    ::param cursor: cursor of the platform SQLite3 database
+    ::param list days: (coin, day) tuples with the day in epoch seconds
+    '''
+    cursor.executemany(REFRESH_DAY, [(COIN, DAY, DAY + 86400) for COIN, DAY in days])
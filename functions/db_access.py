@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Data access layer for the web application.
+
+Each worker process and thread reuses one SQLite3 connection. Statements are
+constant strings with bound parameters, so they are prepared once and reused
+from the connection's statement cache.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import sqlite3
+import threading
+from functions.db_connect import db_configure
+
+DB_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data', 'db.sqlite')
+N_CACHED_STATEMENTS = 64
+connections = threading.local()
+
+# The emoji_counts totals are maintained by a trigger on the emojis log
+SELECT_EMOJI_COUNTS = 'SELECT EMOJI, TOTAL FROM emoji_counts WHERE COIN = ? AND WINDOW = ?'
+INSERT_EMOJI = 'INSERT INTO emojis (UTC_TIME, EMOJI, WINDOW, COIN) VALUES (?, ?, ?, ?)'
+
+def db_connection():
+    '''Return the database connection for the current worker thread
+
+    The connection is opened on first use and reopened after a fork,
+    because SQLite3 connections must not be shared across processes.
+    '''
+    con = getattr(connections, 'con', None)
+    if con is None or connections.pid != os.getpid():
+        con = sqlite3.connect(DB_FILE, isolation_level=None, timeout=10, cached_statements=N_CACHED_STATEMENTS)
+        db_configure(con)
+        connections.con = con
+        connections.pid = os.getpid()
+    return con
+
+def db_query(statement, params=()):
+    '''Run a read-only statement with bound parameters and return all rows
+    '''
+    cursor = db_connection().execute(statement, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    return rows
+
+def db_execute_many(statement, rows):
+    '''Run a write statement for many rows of bound parameters in one transaction
+    '''
+    cursor = db_connection().cursor()
+    cursor.execute('BEGIN')
+    try:
+        cursor.executemany(statement, rows)
+        cursor.execute('COMMIT')
+    except:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+
+def emoji_counts(COIN, WINDOW):
+    '''Look up the emoji vote totals for a coin and time window
+
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    '''
+    return dict(db_query(SELECT_EMOJI_COUNTS, (COIN, WINDOW)))
+
+def emoji_insert_many(votes):
+    '''Record a batch of emoji votes in one transaction
+
+    ::param list votes: (UTC_TIME, EMOJI, WINDOW, COIN) tuples
+    '''
+    db_execute_many(INSERT_EMOJI, votes)
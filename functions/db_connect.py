@@ -10,6 +10,25 @@ import os
 import sqlite3
 from sqlite3 import Error
 
+# Write-ahead logging lets the web application read while the pipeline writes
+# NORMAL synchronization is durable across application crashes in WAL mode
+DB_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -32000',
+    'PRAGMA temp_store = MEMORY',
+    ]
+
+def db_configure(con):
+    '''apply the platform pragmas to a database connection
+    
+    ::param con: connection to the platform SQLite3 database
+    '''
+    for statement in DB_PRAGMAS:
+        con.execute(statement)
+    return con
+
 def db_connect(db_file):
     '''create a database connection
     
@@ -19,6 +38,7 @@ def db_connect(db_file):
     try:
         
         con = sqlite3.connect(db_file, isolation_level=None, timeout=10)
+        db_configure(con)
         if os.path.exists(db_file):
             
             print("[INFO] Successfully connected to the database", db_file)
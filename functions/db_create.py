@@ -1,52 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Used to initialize the SQLite3 database from scratch.
+Used to initialize the SQLite3 database from scratch, or to migrate an
+existing database to the latest schema version.
 
-@author: dale
+@author: Dale Kube (dkube@uwalumni.com)
 """
 
-## DEVELOPMENT ONLY
-## import os
-## os.chdir('/home/dale/Downloads/GitHub/TwentyFourCoins/functions')
+import os
+from db_connect import db_connect
+from db_migrate import db_migrate
 
 # Create a database object if it doesn't already exist
-from db_connect import db_connect
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
 con = db_connect('../data/db.sqlite')
-cursor = con.cursor()
-
-# Create the 'prices' table
-statement = '\
-CREATE TABLE IF NOT EXISTS prices (\
-coin TEXT NOT NULL,\
-time DATETIME NOT NULL,\
-low FLOAT NOT NULL,\
-high FLOAT NOT NULL,\
-open FLOAT NOT NULL,\
-close FLOAT NOT NULL,\
-volume INT NOT NULL\
-)\
-'
-cursor.execute(statement)
 
-# Random queries to validate changes
-statement = 'SELECT * FROM logs'
-statement = 'SELECT * FROM logs ORDER BY UTC_TIME DESC LIMIT 10'
-statement = 'SELECT * FROM prices LIMIT 10'
-statement = 'pragma table_info("logs")'
-cursor.execute(statement)
-cursor.fetchall()
+# Apply the pending schema migrations
+db_migrate(con)
 
-# Close the cursor and connection
-cursor.close()
+# Close the database connection
 con.close()
-
-statement = 'pragma table_info("prices")'
-statement = 'SELECT * FROM prices LIMIT 15'
-statement = 'UPDATE prices SET time = datetime(time, "unixepoch", "utc")'
-
-statement = 'DROP TABLE prices'
-cursor.execute(statement)
-cursor.fetchall()
-cursor.commit()
-con.commit()
+print('[FINISHED] The database schema is up to date')
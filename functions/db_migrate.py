@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Versioned schema migrations for the platform SQLite3 database.
+
+The applied version is tracked with PRAGMA user_version, and each migration
+runs in its own transaction, so the migrations are safe to run on every
+start of the pipeline.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+MIGRATIONS = [
+
+    # 1. Platform tables
+    ('Create the platform tables', [
+        'CREATE TABLE IF NOT EXISTS prices_coinbase (coin TEXT NOT NULL, time DATETIME NOT NULL, price FLOAT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS prices_nomics (coin TEXT NOT NULL, time DATETIME NOT NULL, price FLOAT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS predictions (COIN TEXT NOT NULL, ACTUAL_TIME DATETIME NOT NULL, ACTUAL_PRICE FLOAT NOT NULL, \
+        PREDICTION_TIME DATETIME NOT NULL, PREDICTION FLOAT NOT NULL, WINDOW INT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS model_performance (UTC_TIME DATETIME NOT NULL, MAE FLOAT NOT NULL, MAPE FLOAT NOT NULL, \
+        COIN TEXT NOT NULL, WINDOW INT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS emojis (UTC_TIME DATETIME NOT NULL, EMOJI TEXT NOT NULL, WINDOW INT NOT NULL, COIN TEXT NOT NULL)',
+        ]),
+
+    # 2. Cluster the candles by coin and time, which covers every price query
+    # Duplicate candles are dropped, keeping the most recently inserted row
+    ('Cluster prices_coinbase on (coin, time)', [
+        'DROP INDEX IF EXISTS prices_coinbase_coin_time',
+        'CREATE TABLE prices_coinbase_v2 (coin TEXT NOT NULL, time DATETIME NOT NULL, price FLOAT NOT NULL, \
+        PRIMARY KEY (coin, time)) WITHOUT ROWID',
+        'INSERT OR REPLACE INTO prices_coinbase_v2 (coin, time, price) SELECT coin, time, price FROM prices_coinbase ORDER BY rowid',
+        'DROP TABLE prices_coinbase',
+        'ALTER TABLE prices_coinbase_v2 RENAME TO prices_coinbase',
+        ]),
+
+    # 3. Covering indexes for the pipeline and web queries
+    ('Add covering indexes', [
+        'CREATE INDEX IF NOT EXISTS predictions_coin_window ON predictions (COIN, WINDOW, PREDICTION_TIME, PREDICTION)',
+        'CREATE INDEX IF NOT EXISTS model_performance_coin_window ON model_performance (COIN, WINDOW, MAE, UTC_TIME)',
+        'CREATE INDEX IF NOT EXISTS emojis_coin_window ON emojis (COIN, WINDOW, EMOJI)',
+        ]),
+
+    # 4. Store the candle and prediction times as integer epoch seconds
+    # The SPY feature table is derived data and is rebuilt with epoch times
+    ('Convert the candle and prediction times to epoch seconds', [
+        'CREATE TABLE prices_coinbase_v3 (coin TEXT NOT NULL, time INTEGER NOT NULL, price FLOAT NOT NULL, \
+        PRIMARY KEY (coin, time)) WITHOUT ROWID',
+        'INSERT OR REPLACE INTO prices_coinbase_v3 (coin, time, price) \
+        SELECT coin, CAST(strftime("%s", time) AS INTEGER), price FROM prices_coinbase',
+        'DROP TABLE prices_coinbase',
+        'ALTER TABLE prices_coinbase_v3 RENAME TO prices_coinbase',
+        'UPDATE predictions SET ACTUAL_TIME = CAST(strftime("%s", ACTUAL_TIME) AS INTEGER), \
+        PREDICTION_TIME = CAST(strftime("%s", PREDICTION_TIME) AS INTEGER) WHERE typeof(PREDICTION_TIME) = "text"',
+        'DROP TABLE IF EXISTS features_stock_spy',
+        ]),
+
+    # 5. Emoji vote totals maintained on every insert into the emojis log
+    ('Maintain the emoji vote totals', [
+        'CREATE TABLE emoji_counts (COIN TEXT NOT NULL, WINDOW INT NOT NULL, EMOJI TEXT NOT NULL, TOTAL INT NOT NULL, \
+        PRIMARY KEY (COIN, WINDOW, EMOJI)) WITHOUT ROWID',
+        'INSERT INTO emoji_counts (COIN, WINDOW, EMOJI, TOTAL) \
+        SELECT COIN, WINDOW, EMOJI, COUNT(*) FROM emojis GROUP BY COIN, WINDOW, EMOJI',
+        'CREATE TRIGGER emojis_count AFTER INSERT ON emojis BEGIN \
+        INSERT INTO emoji_counts (COIN, WINDOW, EMOJI, TOTAL) VALUES (NEW.COIN, NEW.WINDOW, NEW.EMOJI, 1) \
+        ON CONFLICT (COIN, WINDOW, EMOJI) DO UPDATE SET TOTAL = TOTAL + 1; END',
+        ]),
+
+    # 6. Registry of the trained model artifacts, keyed for the lookup of the newest models
+    # The bz2 pickled models are not registered, so every pair is retrained once
+    ('Create the model registry', [
+        'CREATE TABLE model_registry (COIN TEXT NOT NULL, WINDOW INT NOT NULL, TRAINED_TIME INTEGER NOT NULL, \
+        ARTIFACT TEXT NOT NULL, BEST_MODEL TEXT NOT NULL, MOV_AVG_COL TEXT NOT NULL, MAE FLOAT NOT NULL, MAPE FLOAT NOT NULL, \
+        FINGERPRINT TEXT NOT NULL, PRIMARY KEY (COIN, WINDOW, TRAINED_TIME)) WITHOUT ROWID',
+        ]),
+
+    # 7. Daily SPY prices, and the pairs of each day with the previous trading day keyed by day
+    # The SPY feature table is derived data and is rebuilt from the daily prices
+    ('Store the daily SPY prices and key the SPY features by day', [
+        'DROP TABLE IF EXISTS features_stock_spy',
+        'CREATE TABLE prices_stock_spy (stock_spy_time INTEGER NOT NULL PRIMARY KEY, \
+        stock_spy_open FLOAT NOT NULL, stock_spy_close FLOAT NOT NULL)',
+        'CREATE TABLE features_stock_spy (time INTEGER NOT NULL PRIMARY KEY, stock_spy_time INTEGER NOT NULL, \
+        stock_spy_open FLOAT NOT NULL, stock_spy_close FLOAT NOT NULL)',
+        ]),
+
+    # 8. Daily aggregates of the candles, refreshed by the ingestion for the touched days
+    # Frozen as the aggregates of DAILY_AGGREGATES at the time, later changes call rebuild_daily_prices
+    ('Materialize the daily price aggregates', [
+        'CREATE TABLE daily_prices (coin TEXT NOT NULL, day INTEGER NOT NULL, open_price FLOAT NOT NULL, \
+        close_price FLOAT NOT NULL, max_price FLOAT NOT NULL, min_price FLOAT NOT NULL, n_candles INT NOT NULL, \
+        PRIMARY KEY (coin, day)) WITHOUT ROWID',
+        'INSERT INTO daily_prices (coin, day, open_price, close_price, max_price, min_price, n_candles) \
+        SELECT c.coin, c.time / 86400 * 86400 AS day, \
+        (SELECT p.price FROM prices_coinbase AS p WHERE p.coin = c.coin AND p.time >= c.time / 86400 * 86400 ORDER BY p.time LIMIT 1), \
+        (SELECT p.price FROM prices_coinbase AS p WHERE p.coin = c.coin AND p.time < c.time / 86400 * 86400 + 86400 ORDER BY p.time DESC LIMIT 1), \
+        MAX(c.price), MIN(c.price), COUNT(*) FROM prices_coinbase AS c GROUP BY c.coin, day',
+        ]),
+
+    ]
+
+def db_migrate(con):
+    '''Apply the pending schema migrations to the database
+
+    ::param con: connection to the platform SQLite3 database
+    '''
+    cursor = con.cursor()
+    cursor.execute('PRAGMA user_version')
+    DB_VERSION = cursor.fetchone()[0]
+
+    for VERSION, (description, statements) in enumerate(MIGRATIONS, start=1):
+
+        if VERSION <= DB_VERSION:
+            continue
+
+        print('[INFO] Applying database migration', VERSION, '-', description)
+        cursor.execute('BEGIN')
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute('PRAGMA user_version = %d' % VERSION)
+            cursor.execute('COMMIT')
+        except:
+            cursor.execute('ROLLBACK')
+            raise
+
+    cursor.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Level-of-detail downsampling for the chart series.
+
+Each series is kept as a pyramid of min/max bucket downsamples, from the
+full resolution to a few hundred points. A chart request for a time range
+and pixel width is served from the coarsest level that still has about
+two points per pixel in that range.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+
+LOD_FACTOR = 4
+LOD_MIN_POINTS = 500
+
+def minmax_downsample(times, values, n_buckets):
+    '''Keep the first, last, minimum, and maximum point of each bucket
+
+    Returns at most 2*n_buckets+2 points in time order, so peaks and
+    troughs survive the downsampling.
+
+    ::param array times: sorted times of the series
+    ::param array values: values of the series
+    ::param int n_buckets: number of equally sized buckets
+    '''
+    times = np.asarray(times)
+    values = np.asarray(values)
+    N = len(values)
+    if N <= 2*n_buckets + 2:
+        return times, values
+
+    # Pad the last bucket with its final value so every bucket has equal size
+    size = -(-N // n_buckets)
+    padded = np.empty(size*n_buckets, dtype=values.dtype)
+    padded[:N] = values
+    padded[N:] = values[-1]
+    buckets = padded.reshape(n_buckets, size)
+    starts = np.arange(n_buckets) * size
+
+    idx = np.concatenate([[0, N-1], starts + buckets.argmin(axis=1), starts + buckets.argmax(axis=1)])
+    idx = np.unique(np.minimum(idx, N-1))
+    return times[idx], values[idx]
+
+def lod_pyramid(times, values):
+    '''Build the downsampling levels of a series, from finest to coarsest
+
+    Each level has about 1/LOD_FACTOR of the points of the previous level.
+
+    ::param array times: sorted times of the series
+    ::param array values: values of the series
+    '''
+    levels = [(np.asarray(times), np.asarray(values))]
+    while len(levels[-1][1]) > LOD_MIN_POINTS:
+        t, v = levels[-1]
+        N_BUCKETS = max(1, len(v) // (2*LOD_FACTOR))
+        levels.append(minmax_downsample(t, v, N_BUCKETS))
+    return levels
+
+def lod_select(levels, start, end, width):
+    '''Select the visible part of the coarsest level with enough detail
+
+    The slice includes one point beyond each side of the time range so the
+    line continues to the edges of the chart.
+
+    ::param list levels: (times, values) levels from lod_pyramid
+    ::param start: first visible time
+    ::param end: last visible time
+    ::param int width: chart width in pixels
+    '''
+    for t, v in reversed(levels):
+        i = max(0, np.searchsorted(t, start, side='left') - 1)
+        j = min(len(t), np.searchsorted(t, end, side='right') + 1)
+        if j - i >= 2*width:
+            break
+    return t[i:j], v[i:j]
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Write-behind queue for emoji votes in the web application.
+
+Votes are throttled per client in memory, queued, and written by a
+background thread in one transaction per batch. A batch that fails to save,
+such as while another writer holds the database lock, is retried with
+backoff. The queue is drained when the worker process exits.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from functions.db_access import emoji_insert_many
+from functions.rate_limiter import TokenBucket
+
+class EmojiWriter:
+    '''Coalesce emoji votes and flush them to the database in batches
+
+    ::param float flush_interval: maximum seconds a vote waits in the queue
+    ::param int max_batch: number of votes that triggers an immediate flush
+    ::param float client_rate: votes per second allowed for each client
+    ::param float client_burst: burst of votes allowed for each client
+    ::param int max_clients: number of tracked clients before idle ones are dropped
+    ::param int max_retries: attempts to save a failed batch again before it is dropped
+    ::param float retry_delay: seconds before the first retry, doubled after each one
+    '''
+
+    def __init__(self, flush_interval=0.5, max_batch=100, client_rate=1, client_burst=5, max_clients=10000, max_retries=5, retry_delay=0.5):
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_batch = max_batch
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.max_clients = max_clients
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+
+    def _start(self):
+
+        # Start the writer thread in each worker process on first use
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.clients = {}
+                self.thread = threading.Thread(target=self._run, name='emoji-writer', daemon=True)
+                self.thread.start()
+                self.pid = os.getpid()
+                atexit.register(self.close)
+
+    def _allow(self, client):
+
+        # Drop the idle clients when too many are tracked
+        # A client is idle once its bucket has refilled completely
+        with self.lock:
+            bucket = self.clients.get(client)
+            if bucket is None:
+                if len(self.clients) >= self.max_clients:
+                    self.clients = {k:v for k, v in self.clients.items() if not v.try_acquire(v.capacity)}
+                bucket = TokenBucket(self.client_rate, self.client_burst)
+                self.clients[client] = bucket
+        return bucket.try_acquire()
+
+    def submit(self, client, EMOJI, WINDOW, COIN):
+        '''Queue one emoji vote, returning False if the client is throttled
+
+        ::param str client: client address used for throttling
+        ::param str EMOJI: emoji code, such as E01
+        ::param int WINDOW: time window in five minute bundles
+        ::param str COIN: coin identifier, such as BTC-USD
+        '''
+        self._start()
+        if not self._allow(client):
+            return False
+
+        UTC_TIME = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        self.queue.put((UTC_TIME, EMOJI, WINDOW, COIN))
+        return True
+
+    def _run(self):
+
+        # Wait for the first vote, then collect more until the batch is full
+        # or the flush interval has passed
+        running = True
+        while running:
+
+            vote = self.queue.get()
+            if vote is None:
+                break
+            batch = [vote]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    vote = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if vote is None:
+                    running = False
+                    break
+                batch.append(vote)
+
+            self._save(batch)
+
+    def _save(self, batch):
+
+        # Retry the batch with exponential backoff before dropping it
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                emoji_insert_many(batch)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print('[ERROR] Failed to save', len(batch), 'emoji votes after', attempt + 1, 'attempts:', e)
+                    return
+                print('[INFO] Retrying to save', len(batch), 'emoji votes in', delay, 'seconds:', e)
+                time.sleep(delay)
+                delay *= 2
+
+    def close(self):
+        '''Flush the queued votes and stop the writer thread
+        '''
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
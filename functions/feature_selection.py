@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prune collinear features before model fitting with correlation clustering.
+
+The moving averages of neighboring windows are almost perfectly correlated
+with each other and with the price. The columns are visited in their
+training order and a column is kept only when its absolute correlation with
+every kept column is below the threshold, so each kept column represents a
+cluster of near-duplicates.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+
+def select_features(x, threshold, max_rows=20000):
+    '''Choose one representative column of each cluster of correlated features
+
+    The correlations are estimated on at most max_rows evenly spaced rows.
+    Constant columns have no defined correlation and are always kept.
+    Returns the indices of the kept columns in their original order.
+
+    ::param array x: training feature matrix
+    ::param float threshold: absolute correlation at which columns are clustered
+    ::param int max_rows: maximum rows for the correlation estimate
+    '''
+    step = max(1, len(x) // max_rows)
+    sample = np.asarray(x[::step], dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = np.abs(np.corrcoef(sample, rowvar=False))
+    corr = np.nan_to_num(np.atleast_2d(corr), nan=0.0)
+
+    kept = []
+    for j in range(sample.shape[1]):
+        if all(corr[j, k] < threshold for k in kept):
+            kept.append(j)
+
+    return kept
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent feature store for the price history and moving average features.
+
+Each coin has a directory with raw column files and a small manifest:
+
+    data/features/<COIN>/manifest.json
+    data/features/<COIN>/time.bin             int64 epoch seconds
+    data/features/<COIN>/price.bin            float64
+    data/features/<COIN>/moving_averages.bin  float64 (rows x windows)
+
+The manifest row count is authoritative. Before the column files are
+rewritten, the manifest is reduced to the rows that are kept, and the new
+rows are written in place with the files shrunk only at the end. An
+interrupted synchronization therefore leaves a valid store with fewer rows,
+which the next synchronization rebuilds. A store whose files are shorter
+than its manifest is rebuilt as well.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import json
+import numpy as np
+from moving_averages import moving_averages, moving_average_windows
+
+FEATURE_STORE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data', 'features')
+STORE_COLUMNS = {'time':np.int64, 'price':np.float64, 'moving_averages':np.float64}
+
+# Count and sum of the prices before a time, summed by SQLite in time order
+HISTORY_CHECKSUM = 'SELECT COUNT(*), TOTAL(price) FROM prices_coinbase WHERE coin = ? AND time < ?'
+
+def _store_path(COIN, name):
+    return os.path.join(FEATURE_STORE_DIR, COIN, name)
+
+def _read_manifest(COIN):
+    MANIFEST = _store_path(COIN, 'manifest.json')
+    if not os.path.exists(MANIFEST):
+        return None
+    with open(MANIFEST) as f:
+        return json.load(f)
+
+def _write_manifest(COIN, manifest):
+    MANIFEST = _store_path(COIN, 'manifest.json')
+    with open(MANIFEST + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(MANIFEST + '.tmp', MANIFEST)
+
+def _row_bytes(name, windows):
+    return np.dtype(STORE_COLUMNS[name]).itemsize * (len(windows) if name == 'moving_averages' else 1)
+
+def _store_complete(COIN, manifest):
+    '''Check that every column file holds the rows of the manifest
+    '''
+    for name in STORE_COLUMNS:
+        COLUMN_FILE = _store_path(COIN, name + '.bin')
+        SIZE = os.path.getsize(COLUMN_FILE) if os.path.exists(COLUMN_FILE) else 0
+        if SIZE < manifest['rows'] * _row_bytes(name, manifest['windows']):
+            return False
+    return True
+
+def feature_store_open(config, COIN):
+    '''Open the stored features for a coin as read-only memory maps
+
+    Returns a dictionary with the 'time', 'price', and 'moving_averages'
+    arrays plus the list of moving average 'windows'. No data is copied
+    into memory until the arrays are used.
+
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    '''
+    manifest = _read_manifest(COIN)
+    assert manifest is not None, '[ERROR] The feature store does not exist for ' + COIN
+    N = manifest['rows']
+    K = len(manifest['windows'])
+    assert manifest['windows'] == moving_average_windows(config), '[ERROR] The feature store windows do not match the configuration'
+    assert _store_complete(COIN, manifest), '[ERROR] The feature store for ' + COIN + ' is incomplete and is rebuilt by the next synchronization'
+
+    store = {'windows':manifest['windows']}
+    for name, dtype in STORE_COLUMNS.items():
+        shape = (N, K) if name == 'moving_averages' else (N,)
+        if N == 0:
+            store[name] = np.empty(shape, dtype=dtype)
+        else:
+            store[name] = np.memmap(_store_path(COIN, name + '.bin'), dtype=dtype, mode='r', shape=shape)
+
+    return store
+
+def feature_store_sync(con, config, COIN):
+    '''Append new candles to the feature store for a coin
+
+    Only the rows from the start of the last stored UTC day onward are
+    reread from the database, because the collector refreshes the current
+    day on every run. The moving averages for those rows are recalculated
+    with the trailing prices already in the store. The full store is rebuilt
+    when the row count or the price checksum of the earlier history in the
+    database no longer matches the manifest.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    '''
+    windows = moving_average_windows(config)
+    N_CONTEXT = max(windows) - 1
+    os.makedirs(_store_path(COIN, ''), exist_ok=True)
+
+    # Start from scratch if the store is missing, incomplete, or the windows have changed
+    manifest = _read_manifest(COIN)
+    if manifest is None or manifest['windows'] != windows or not _store_complete(COIN, manifest):
+        manifest = {'rows':0, 'windows':windows}
+
+    # Read the history in one transaction, so the candles and the checksums are consistent
+    KEEP = 0
+    context = np.empty(0, dtype=np.float64)
+    cursor = con.cursor()
+    cursor.execute('BEGIN')
+    try:
+
+        # Rewind to the start of the last stored day
+        # Validate the history before the rewind point with the count and checksum of its prices
+        if manifest['rows'] > 0:
+
+            store = feature_store_open(config, COIN)
+            day_start = int(store['time'][-1]) // 86400 * 86400
+            KEEP = int(np.searchsorted(store['time'], day_start, side='left'))
+            cursor.execute(HISTORY_CHECKSUM, (COIN, day_start))
+            N_BEFORE, TOTAL_BEFORE = cursor.fetchone()
+            if N_BEFORE != KEEP or manifest.get('checksum') != [day_start, N_BEFORE, TOTAL_BEFORE]:
+                print('[INFO] Rebuilding the feature store for', COIN, 'after changes to the history')
+                KEEP = 0
+            else:
+                context = np.array(store['price'][max(0, KEEP-N_CONTEXT):KEEP])
+                LAST_KEPT_TIME = int(store['time'][KEEP-1]) if KEEP > 0 else None
+            del store
+
+        # Collect the candles after the rewind point
+        statement = 'SELECT time, price FROM prices_coinbase WHERE coin = ? AND time >= ? ORDER BY time'
+        since = day_start if KEEP > 0 else 0
+        cursor.execute(statement, (COIN, since))
+        rows = cursor.fetchall()
+
+        # Checksum of the history before the next rewind point
+        checksum = None
+        if KEEP + len(rows) > 0:
+            next_day_start = int(rows[-1][0] if len(rows) > 0 else LAST_KEPT_TIME) // 86400 * 86400
+            cursor.execute(HISTORY_CHECKSUM, (COIN, next_day_start))
+            checksum = [next_day_start] + list(cursor.fetchone())
+        cursor.execute('COMMIT')
+
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+
+    new_time = np.array([r[0] for r in rows], dtype=np.int64)
+    new_price = np.array([r[1] for r in rows], dtype=np.float64)
+    N_NEW = len(new_price)
+
+    # Calculate the moving averages with the trailing context prices
+    new_mov_avgs = moving_averages(np.concatenate([context, new_price]), windows)[len(context):]
+
+    # Reduce the manifest to the kept rows before the column files are rewritten
+    # The new rows are written in place, and the files only shrink after they are written
+    _write_manifest(COIN, {'rows':KEEP, 'windows':windows})
+    new_columns = {'time':new_time, 'price':new_price, 'moving_averages':new_mov_avgs}
+    for name, dtype in STORE_COLUMNS.items():
+        COLUMN_FILE = _store_path(COIN, name + '.bin')
+        ROW_BYTES = _row_bytes(name, windows)
+        with open(COLUMN_FILE, 'r+b' if os.path.exists(COLUMN_FILE) else 'wb') as f:
+            f.seek(KEEP * ROW_BYTES)
+            f.write(np.ascontiguousarray(new_columns[name], dtype=dtype).tobytes())
+            f.truncate((KEEP + N_NEW) * ROW_BYTES)
+
+    manifest = {'rows':KEEP + N_NEW, 'windows':windows, 'checksum':checksum}
+    _write_manifest(COIN, manifest)
+    print('[INFO] Feature store for', COIN, 'has', '{:,}'.format(manifest['rows']), 'rows with',
+          '{:,}'.format(N_NEW), 'recalculated')
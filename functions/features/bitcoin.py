@@ -21,7 +21,7 @@ import pandas as pd
 
 def features_bitcoin(con):
     
-    TABLE_NAME = 'prices_coinbase'
+    TABLE_NAME = 'daily_prices'
     
     # Check if the table already exists
     cursor = con.cursor()
@@ -29,18 +29,13 @@ def features_bitcoin(con):
     cursor.execute(statement)    
     table_check = cursor.fetchall()
     cursor.close()
-    assert len(table_check) == 1, '[ERROR] prices_coinbase table does not exist yet'
+    assert len(table_check) == 1, '[ERROR] daily_prices table does not exist yet'
     
-    # Gather all of the bitcoin prices
-    statement = 'SELECT time, price FROM %s WHERE COIN="BTC-USD"' % TABLE_NAME
+    # Gather the maximum bitcoin price for each UTC day from the daily aggregates
+    statement = 'SELECT day AS time_merge, max_price AS btc_price \
+    FROM %s WHERE coin="BTC-USD" ORDER BY day' % TABLE_NAME
     all_prices = pd.read_sql(statement, con)
-    all_prices['time'] = pd.to_datetime(all_prices['time'])
-    all_prices.rename(columns={'time':'time_merge'}, inplace=True)
-    
-    all_prices['time_merge'] = all_prices['time_merge'].dt.strftime('%Y-%m-%d')
-    all_prices = all_prices.groupby('time_merge')['price'].max().reset_index()
-    all_prices['time_merge'] = pd.to_datetime(all_prices['time_merge'])
-    all_prices.rename(columns={'price':'btc_price'}, inplace=True)
+    all_prices['time_merge'] = all_prices['time_merge'].values.astype('datetime64[s]').astype('datetime64[ns]')
     
     print('[INFO] Finished gathering historical Bitcoin prices')
     return all_prices
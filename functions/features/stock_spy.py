@@ -5,14 +5,38 @@ Generate the data for the SPY (SPDR S&P 500 ETF Trust) stock which
 mirrors the overall S&P 500 index. This data is used to improve the performance
 of the individual models by incorporating information about the stock market trends.
 
+The daily SPY prices are kept in prices_stock_spy, and every UTC day since the
+first crypto candle is paired with the last trading day before it in
+features_stock_spy. The pairs come from a sorted as-of join, and only the days
+after the last paired day, or after the first newly downloaded trading day,
+are paired on each update.
+
+The daily prices can be read from a local CSV file with Date, Open, and Close
+columns instead of yfinance, by setting SPY_PRICES_CSV in config.json or the
+environment.
+
 DEPENDENCY: runs from within the train_models.py code.
 
 @author: dale
 """
 
-import yfinance as yf
+import os
+import time
+import numpy as np
 import pandas as pd
-from datetime import datetime as dt
+
+UPSERT_PRICES = '''
+INSERT INTO prices_stock_spy (stock_spy_time, stock_spy_open, stock_spy_close) VALUES (?, ?, ?)
+ON CONFLICT (stock_spy_time) DO UPDATE SET stock_spy_open = excluded.stock_spy_open, stock_spy_close = excluded.stock_spy_close
+'''
+UPSERT_FEATURES = 'INSERT OR REPLACE INTO features_stock_spy (time, stock_spy_time, stock_spy_open, stock_spy_close) VALUES (?, ?, ?, ?)'
+
+# The last trading day before the first day to pair, and every trading day after it
+SELECT_PRICES = '''
+SELECT stock_spy_time, stock_spy_open, stock_spy_close FROM prices_stock_spy
+WHERE stock_spy_time >= COALESCE((SELECT MAX(stock_spy_time) FROM prices_stock_spy WHERE stock_spy_time < ?), 0)
+ORDER BY stock_spy_time
+'''
 
 def reshape_stock_spy(df):
     df = df.reset_index()
@@ -22,63 +46,89 @@ def reshape_stock_spy(df):
     df.columns = ['stock_spy_time','stock_spy_open','stock_spy_close']
     return df
 
-def features_stock_spy(con):
+def epoch_seconds(times):
+    return times.values.astype('datetime64[s]').astype('int64')
+
+def epoch_datetimes(times):
+    return times.values.astype('int64').astype('datetime64[s]').astype('datetime64[ns]')
+
+def download_stock_spy(config, START, END):
+    '''Download the daily SPY prices of the trading days from START up to END
     
-    TABLE_NAME = 'features_stock_spy'
+    ::param dict config: platform configuration from config.json
+    ::param int START: first day in epoch seconds, or 0 for the full history
+    ::param int END: day after the last day in epoch seconds
+    '''
+    SPY_PRICES_CSV = os.environ.get('SPY_PRICES_CSV', config['SPY_PRICES_CSV'])
+    if SPY_PRICES_CSV:
+        prices = pd.read_csv(SPY_PRICES_CSV)
+    else:
+        import yfinance as yf
+        if START == 0:
+            prices = yf.download('SPY', period='max', interval='1d', progress=False)
+        else:
+            START_DATE = time.strftime('%Y-%m-%d', time.gmtime(START))
+            END_DATE = time.strftime('%Y-%m-%d', time.gmtime(END))
+            prices = yf.download('SPY', start=START_DATE, end=END_DATE, interval='1d', progress=False)
     
-    # Check if the table already exists
+    prices = reshape_stock_spy(prices)
+    prices['stock_spy_time'] = epoch_seconds(prices['stock_spy_time'])
+    prices = prices[(prices['stock_spy_time'] >= START) & (prices['stock_spy_time'] < END)]
+    return prices.sort_values('stock_spy_time')
+
+def features_stock_spy(con, config):
+
+    TODAY = int(time.time()) // 86400 * 86400
     cursor = con.cursor()
-    statement = 'SELECT name FROM sqlite_master WHERE type="table" AND name="%s"' % TABLE_NAME
-    cursor.execute(statement)    
-    table_check = cursor.fetchall()
-    cursor.close()
+    cursor.execute('SELECT MAX(stock_spy_time) FROM prices_stock_spy')
+    MAX_SPY_TIME = cursor.fetchone()[0]
+    cursor.execute('SELECT MAX(time) FROM features_stock_spy')
+    MAX_DAY = cursor.fetchone()[0]
     
-    # Populate the historical prices for SPY if starting new
-    # Otherwise, append new daily prices upon the existing table
-    if len(table_check) == 0:
-        
-        prices = yf.download('SPY', period='max', interval='1d', progress=False)
-        prices = reshape_stock_spy(prices)
-        
-        statement = 'SELECT time FROM prices_coinbase'
-        crypto_times = pd.read_sql(statement, con)
-        crypto_times['time'] = pd.to_datetime(crypto_times['time']).dt.strftime('%Y-%m-%d')
-        crypto_times['time'] = pd.to_datetime(crypto_times['time'])
-        crypto_times.drop_duplicates(inplace=True)
-        
-        prices = prices[prices['stock_spy_time'] >= min(crypto_times['time']) - pd.DateOffset(365)]
-        crypto_times = crypto_times['time'].to_list()
-        
-        max_times = [max(prices[prices['stock_spy_time'] < t]['stock_spy_time']) for t in crypto_times]
-        pairs = pd.DataFrame({'time':crypto_times, 'stock_spy_time':max_times})
-        prices = prices.merge(pairs, on=['stock_spy_time'])
-        
-        prices.to_sql(TABLE_NAME, con, if_exists='replace', index=False)
+    # Download the trading days after the last stored day, up to yesterday
+    START = 0 if MAX_SPY_TIME is None else MAX_SPY_TIME + 86400
+    prices = download_stock_spy(config, START, TODAY) if START < TODAY else None
     
+    # Pair the days after the last paired day, starting with the first crypto candle
+    # New trading days change the pairs of every day after them
+    if MAX_DAY is None:
+        statement = 'SELECT MIN(time) FROM prices_coinbase WHERE coin = ?'
+        first_times = [cursor.execute(statement, (COIN,)).fetchone()[0] for COIN in config['SUPPORTED_COINS'].values()]
+        first_times = [t for t in first_times if t is not None]
+        FIRST_DAY = min(first_times) // 86400 * 86400 if len(first_times) > 0 else TODAY + 86400
     else:
+        FIRST_DAY = MAX_DAY + 86400
+        if prices is not None and len(prices) > 0:
+            FIRST_DAY = min(FIRST_DAY, int(prices['stock_spy_time'].iloc[0]) + 86400)
+    
+    cursor.execute('BEGIN')
+    try:
+        if prices is not None and len(prices) > 0:
+            rows = zip(prices['stock_spy_time'].tolist(), prices['stock_spy_open'].tolist(), prices['stock_spy_close'].tolist())
+            cursor.executemany(UPSERT_PRICES, rows)
         
-        statement = 'SELECT MAX(stock_spy_time) AS MAX_TIME FROM %s' % TABLE_NAME
-        max_date = pd.read_sql(statement, con)['MAX_TIME'].iloc[0]
-        max_date = pd.to_datetime(max_date)
-        
-    if max_date < dt.utcnow():
-        max_date_plus1 = max_date + pd.DateOffset(1)
-        max_date_plus1 = max_date_plus1.strftime("%Y-%m-%d")
-        today = dt.utcnow().strftime("%Y-%m-%d")
-        if max_date_plus1 != today:
-            prices = yf.download('SPY', start=max_date_plus1, end=today, interval='1d', progress=False)
-            prices = reshape_stock_spy(prices)
-            prices = prices[prices['stock_spy_time'] > max_date]
-            if len(prices) > 0:
-                prices.to_sql(TABLE_NAME, con, if_exists='append', index=False)
+        # Sorted as-of join of each day with the last trading day strictly before it
+        spy = np.array(cursor.execute(SELECT_PRICES, (FIRST_DAY,)).fetchall(), dtype=np.float64).reshape(-1, 3)
+        days = np.arange(FIRST_DAY, TODAY + 86400, 86400, dtype=np.int64)
+        idx = np.searchsorted(spy[:, 0], days, side='left') - 1
+        days, idx = days[idx >= 0], idx[idx >= 0]
+        pairs = zip(days.tolist(), spy[idx, 0].astype(np.int64).tolist(), spy[idx, 1].tolist(), spy[idx, 2].tolist())
+        cursor.executemany(UPSERT_FEATURES, pairs)
+        cursor.execute('COMMIT')
+    except:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+    
+    if len(days) > 0:
+        print('[INFO] Paired', len(days), 'days with the previous SPY trading day')
     
     # Gather all of the stock prices
-    statement = 'SELECT * FROM %s' % TABLE_NAME
+    statement = 'SELECT time, stock_spy_open, stock_spy_close FROM features_stock_spy ORDER BY time'
     all_prices = pd.read_sql(statement, con)
-    all_prices['time'] = pd.to_datetime(all_prices['time'])
+    all_prices['time'] = epoch_datetimes(all_prices['time'])
     all_prices.rename(columns={'time':'time_merge'}, inplace=True)
-    del all_prices['stock_spy_time']
     
     print('[INFO] Finished gathering stock market data for SPY')
     return all_prices
-
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Idempotent bulk ingestion of price candles into the prices_coinbase table.
+
+Each UTC day with fetched candles is replaced as a whole, and the daily
+aggregates of those days are refreshed in the same transaction.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+from daily_prices import refresh_daily_prices
+
+DELETE_DAY = 'DELETE FROM prices_coinbase WHERE coin = ? AND time >= ? AND time < ?'
+UPSERT_CANDLES = '''
+INSERT INTO prices_coinbase (coin, time, price) VALUES (?, ?, ?)
+ON CONFLICT (coin, time) DO UPDATE SET price = excluded.price
+'''
+
+def upsert_candles(con, candles):
+    '''Replace the stored candles of the fetched days in a single transaction
+
+    The stored candles of every coin and UTC day with fetched candles are
+    deleted before the fetched candles are inserted, so refetching a date
+    is idempotent and also removes excessive or off-grid candles. Days
+    without fetched candles keep their stored candles. The daily aggregates
+    of the replaced days are recomputed before the commit.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param list candles: (coin, time, price) tuples
+    '''
+    candles = list(candles)
+    days = sorted({(COIN, int(t) // 86400 * 86400) for COIN, t, price in candles})
+    cursor = con.cursor()
+    cursor.execute('BEGIN')
+    try:
+        cursor.executemany(DELETE_DAY, [(COIN, DAY, DAY + 86400) for COIN, DAY in days])
+        cursor.executemany(UPSERT_CANDLES, candles)
+        refresh_daily_prices(cursor, days)
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
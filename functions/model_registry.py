@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry of the trained model artifacts.
+
+Every training run saves one artifact file and registers it in the
+model_registry table with its metrics, training time, and data fingerprint.
+The current models for a coin and time window are the most recently
+registered, found with one primary key lookup.
+
+Artifacts are uncompressed pickles (protocol 5), which load several times
+faster than the earlier bz2 compressed pickles. See benchmark_model_loading.py.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import json
+import glob
+import pickle
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'models')
+PICKLE_PROTOCOL = 5
+
+REGISTER_MODEL = '''
+INSERT INTO model_registry (COIN, WINDOW, TRAINED_TIME, ARTIFACT, BEST_MODEL, MOV_AVG_COL, MAE, MAPE, FINGERPRINT)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SELECT_LATEST_MODEL = '''
+SELECT COIN, WINDOW, TRAINED_TIME, ARTIFACT, BEST_MODEL, MOV_AVG_COL, MAE, MAPE, FINGERPRINT
+FROM model_registry WHERE COIN = ? AND WINDOW = ? ORDER BY TRAINED_TIME DESC LIMIT 1
+'''
+
+REGISTRY_COLUMNS = ['COIN', 'WINDOW', 'TRAINED_TIME', 'ARTIFACT', 'BEST_MODEL', 'MOV_AVG_COL', 'MAE', 'MAPE', 'FINGERPRINT']
+
+def artifact_path(ARTIFACT):
+    return os.path.join(MODELS_DIR, ARTIFACT)
+
+def register_models(con, COIN, WINDOW, TRAINED_TIME, models, MAE, MAPE, fingerprint):
+    '''Save the model artifact and register it as the current models
+
+    The artifact is written under a temporary name and renamed into place
+    before it is registered in the caller's transaction. Returns the paths
+    of the older artifacts of the coin and time window, which the caller
+    removes with remove_artifacts only after the commit. Their registry rows
+    are kept as history.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param int TRAINED_TIME: training time in epoch seconds
+    ::param dict models: 'rfr', 'lr', 'best_model', and 'mov_avg_col'
+    ::param float MAE: mean absolute error of the best model
+    ::param float MAPE: mean absolute percentage error of the best model
+    ::param dict fingerprint: data fingerprint from data_fingerprint
+    '''
+    ARTIFACT = os.path.join(COIN, str(WINDOW), 'models-%d.pkl' % TRAINED_TIME)
+    ARTIFACT_FILE = artifact_path(ARTIFACT)
+    os.makedirs(os.path.dirname(ARTIFACT_FILE), exist_ok=True)
+    with open(ARTIFACT_FILE + '.tmp', 'wb') as f:
+        pickle.dump(models, f, protocol=PICKLE_PROTOCOL)
+    os.replace(ARTIFACT_FILE + '.tmp', ARTIFACT_FILE)
+
+    cursor = con.cursor()
+    cursor.execute(REGISTER_MODEL, (COIN, WINDOW, TRAINED_TIME, ARTIFACT, models['best_model'], models['mov_avg_col'],
+                                    float(MAE), float(MAPE), json.dumps(fingerprint)))
+    cursor.close()
+    print('[INFO] Registered the models', ARTIFACT_FILE)
+
+    return [f for f in glob.glob(os.path.join(os.path.dirname(ARTIFACT_FILE), 'models*')) if f != ARTIFACT_FILE]
+
+def remove_artifacts(paths):
+    '''Remove artifact files that are no longer registered as the current models
+
+    ::param list paths: artifact files from register_models
+    '''
+    for f in paths:
+        if os.path.exists(f):
+            os.remove(f)
+
+def latest_model(con, COIN, WINDOW):
+    '''Look up the registry entry of the current models, or None
+
+    The fingerprint is decoded from JSON.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    '''
+    cursor = con.cursor()
+    cursor.execute(SELECT_LATEST_MODEL, (COIN, WINDOW))
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        return None
+    entry = dict(zip(REGISTRY_COLUMNS, row))
+    entry['FINGERPRINT'] = json.loads(entry['FINGERPRINT'])
+    return entry
+
+def load_models(entry):
+    '''Load the model objects of a registry entry
+
+    ::param dict entry: registry entry from latest_model
+    '''
+    with open(artifact_path(entry['ARTIFACT']), 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Train and evaluate the models for one coin and time window.
+
+The (coin, window) jobs run one after another or in a process pool from
+train_models.py. In the process pool, the SPY and BTC feature frames are
+shared through shared memory and the price history is read from the feature
+store memory maps, so neither is pickled to the workers.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import gc
+import time
+import random
+import numpy as np
+
+from skranger.ensemble import RangerForestRegressor
+from sklearn.linear_model import LinearRegression
+from threadpoolctl import threadpool_limits
+
+from training_data import training_rows, training_matrix, feature_columns
+from feature_store import feature_store_open
+from moving_averages import moving_average_search_windows, moving_average_search, moving_averages_at
+from feature_selection import select_features
+from db_connect import db_connect
+from shared_frames import attach_frame
+from model_registry import register_models, remove_artifacts
+
+DB_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data', 'db.sqlite')
+N_FEATURE_SAMPLE = 20000
+
+def training_threads(N_WORKERS):
+    '''Split the CPU cores evenly between the concurrent training jobs
+
+    ::param int N_WORKERS: number of concurrent training jobs
+    '''
+    return max(1, (os.cpu_count() or 1) // N_WORKERS)
+
+def base_models(n_jobs):
+    '''Create the unfitted random forest and linear regression models
+
+    ::param int n_jobs: threads for the random forest
+    '''
+    rfr = RangerForestRegressor(n_estimators=31, oob_error=False, sample_fraction=[0.25], n_jobs=n_jobs)
+    lr = LinearRegression(normalize=True)
+    return rfr, lr
+
+def train_window_models(con, config, COIN, WINDOW, prices_spy, prices_btc, n_jobs, memory_budget, fingerprint):
+    '''Train, evaluate, and save the models for a coin and time window
+
+    The models are registered with the data fingerprint for the retraining
+    decision of the next run. Returns the name of the best model and its MAE.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param DataFrame prices_spy: SPY features by day from features_stock_spy
+    ::param DataFrame prices_btc: BTC features by day from features_bitcoin
+    ::param int n_jobs: threads for the random forest and linear algebra
+    ::param int memory_budget: bytes for the training matrix of this job
+    ::param dict fingerprint: data fingerprint from data_fingerprint
+    '''
+    TRAINED_TIME = int(time.time())
+    print('[INFO] Starting the iteration for', COIN)
+    print('[INFO] Time window (5 minute bundles) =', WINDOW)
+    N_TEST_RECENT = 3000
+    N_TEST_RANDOM = 3000
+    M = training_rows(config, COIN, WINDOW)
+    assert M > N_TEST_RECENT + N_TEST_RANDOM, '[ERROR] Not enough rows to train the models for ' + COIN
+    
+    # Keep one feature of each cluster of highly correlated features
+    # The correlations are estimated on evenly spaced rows before the recent test rows
+    all_columns = feature_columns(config, COIN)
+    sample_rows = np.linspace(0, M-N_TEST_RECENT-1, min(N_FEATURE_SAMPLE, M-N_TEST_RECENT)).astype(np.int64)
+    x_sample, y_sample = training_matrix(config, COIN, WINDOW, prices_spy, prices_btc, all_columns, sample_rows)
+    columns = [all_columns[j] for j in select_features(x_sample, float(config['FEATURE_CORRELATION_THRESHOLD']))]
+    print('[INFO] Selected', len(columns), 'of', len(all_columns), 'features')
+    del x_sample, y_sample
+    
+    # Build the matrix of the most recent rows that fit in the memory budget
+    # Each row holds the float32 features, the target, and the store position
+    N_ROWS = min(M, memory_budget // (4*len(columns) + 16))
+    assert N_ROWS > N_TEST_RECENT + N_TEST_RANDOM, '[ERROR] The memory budget is too small to train the models for ' + COIN
+    if N_ROWS < M:
+        print('[INFO] Using the', '{:,}'.format(N_ROWS), 'most recent of', '{:,}'.format(M), 'rows within the memory budget')
+    positions = np.arange(M-N_ROWS, M)
+    x, y = training_matrix(config, COIN, WINDOW, prices_spy, prices_btc, columns, positions)
+    
+    # Split the training and testing data
+    # Use a combinatorial approach, with samples from recent days and random days across history
+    # The random test rows are swapped to the end of the training rows, so each split is a view
+    N_TRAIN = N_ROWS - N_TEST_RECENT - N_TEST_RANDOM
+    random.seed(1000)
+    idx = np.array(random.sample(range(0,N_ROWS-N_TEST_RECENT), N_TEST_RANDOM))
+    tail = np.arange(N_TRAIN, N_ROWS-N_TEST_RECENT)
+    swap_out, swap_in = np.setdiff1d(idx, tail), np.setdiff1d(tail, idx)
+    for a in (x, y, positions):
+        a[swap_out], a[swap_in] = a[swap_in], a[swap_out]
+    
+    x_train, y_train = x[:N_TRAIN], y[:N_TRAIN]
+    x_test, y_test = x[N_TRAIN:], y[N_TRAIN:]
+    test_positions = positions[N_TRAIN:]
+    
+    # Limit the native thread pools to this job's share of the cores
+    with threadpool_limits(limits=n_jobs):
+        
+        # Train  and evaluate the random forest model
+        rfr, lr = base_models(n_jobs)
+        rfr.fit(x_train, y_train)
+        rf_preds = rfr.predict(x_test)
+        
+        # Use the simple moving average as an option
+        # Evaluate every searched window directly from the stored price history
+        prices = feature_store_open(config, COIN)['price']
+        avgs_range = moving_average_search_windows(config)
+        avgs_mae = moving_average_search(prices, test_positions, y_test, avgs_range)
+        best_mov_avg = avgs_range[int(np.argmin(avgs_mae))]
+        mov_avg_col = 'MovingAverage_price_'+str(best_mov_avg)
+        print('[INFO] Using', mov_avg_col, 'as the best moving average of', len(avgs_range), 'windows')
+        mov_avg = moving_averages_at(prices, test_positions, [best_mov_avg])[:, 0]
+        
+        # Linear regression fit
+        lr.fit(x_train, y_train)
+        lr_preds = lr.predict(x_test)
+    
+    # Evaluate all models and ensembles to achieve optimal performance
+    # Ensemble the predictions from both models
+    ensemble_preds_all = (rf_preds+mov_avg+lr_preds)/3.0
+    ensemble_preds_rf_avg = (rf_preds+mov_avg)/2.0
+    ensemble_preds_rf_lr = (rf_preds+lr_preds)/2.0
+    ensemble_preds_avg_lr = (mov_avg+lr_preds)/2.0
+    prediction_sets = {
+            'RangerForestRegressor': rf_preds,
+            'MovingAverage':mov_avg,
+            'LinearRegression':lr_preds,
+            'Ensemble_ALL':ensemble_preds_all,
+            'Ensemble_RF_AVG': ensemble_preds_rf_avg,
+            'Ensemble_RF_LR': ensemble_preds_rf_lr,
+            'Ensemble_AVG_LR': ensemble_preds_avg_lr,
+            }
+    results = {}
+    for model, preds in prediction_sets.items():
+        
+        # Mean Absolute Error
+        MAE = np.mean(abs(preds - y_test))
+        print('[INFO]', COIN, WINDOW, model, 'MAE =', '${:,.6f}'.format(MAE))
+        results[model] = MAE
+    
+    best_model = min(results, key=results.get)
+    print('[INFO] Best model with the lowest MAE =', best_model)
+    best_preds = prediction_sets[best_model]
+    
+    # Calculate the MAE and MAPE with the best set of predictions
+    MAE = np.mean(abs(best_preds - y_test))
+    MAE = '{:.8f}'.format(MAE)
+    MAPE = np.mean(abs((best_preds - y_test)/y_test))
+    MAPE = '{:.8f}'.format(MAPE)
+    
+    # Log the model performance (M01) and register the models in one transaction
+    # The older artifacts are removed only once the new models are committed
+    print('[INFO] Logging the model performance to the database')
+    cursor = con.cursor()
+    cursor.execute('BEGIN')
+    try:
+        statement = 'INSERT INTO model_performance VALUES (datetime(?, "unixepoch"), ?, ?, ?, ?)'
+        cursor.execute(statement, (TRAINED_TIME, float(MAE), float(MAPE), COIN, WINDOW))
+        models = {'rfr':rfr, 'lr':lr, 'best_model':best_model, 'mov_avg_col':mov_avg_col,
+                  'feature_columns':columns}
+        stale_artifacts = register_models(con, COIN, WINDOW, TRAINED_TIME, models, MAE, MAPE, fingerprint)
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+    remove_artifacts(stale_artifacts)
+    
+    return best_model, MAE
+
+def train_job(config, COIN, WINDOW, spy_spec, btc_spec, n_jobs, memory_budget, fingerprint):
+    '''Run one training job in a worker process
+
+    The worker opens its own database connection and attaches to the shared
+    SPY and BTC feature frames.
+
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param dict spy_spec: shared SPY frame description from share_frame
+    ::param dict btc_spec: shared BTC frame description from share_frame
+    ::param int n_jobs: threads for the random forest and linear algebra
+    ::param int memory_budget: bytes for the training matrix of this job
+    ::param dict fingerprint: data fingerprint from data_fingerprint
+    '''
+    con = db_connect(DB_FILE)
+    spy_shm, prices_spy = attach_frame(spy_spec)
+    btc_shm, prices_btc = attach_frame(btc_spec)
+    try:
+        return train_window_models(con, config, COIN, WINDOW, prices_spy, prices_btc, n_jobs, memory_budget, fingerprint)
+    finally:
+        
+        # The views must be released before the shared memory is closed
+        del prices_spy, prices_btc
+        gc.collect()
+        spy_shm.close()
+        btc_shm.close()
+        con.close()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Vectorized moving average features calculated from a single cumulative sum.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+
+def moving_average_windows(config):
+    '''List the moving average windows defined in the platform configuration
+
+    ::param dict config: platform configuration from config.json
+    '''
+    return list(range(int(config['MIN_MOV_AVG']), int(config['MAX_MOV_AVG']), int(config['INTERVAL_MOV_AVG'])))
+
+def moving_average_columns(windows):
+    '''Name the feature columns for the moving average windows
+
+    ::param list windows: moving average window sizes
+    '''
+    return ['MovingAverage_price_' + str(w) for w in windows]
+
+def moving_average_column_window(column):
+    '''Return the window of a moving average column name, or None for other columns
+
+    ::param str column: column name, such as MovingAverage_price_500
+    '''
+    if not column.startswith('MovingAverage_price_'):
+        return None
+    return int(column.rsplit('_', 1)[1])
+
+def moving_averages(prices, windows, out=None):
+    '''Calculate trailing moving averages for several windows at once
+
+    Equivalent to pd.Series.rolling(window=w, min_periods=1).mean() for every
+    window w, where the first w-1 rows average over the available history.
+    All windows are derived from one cumulative sum of the prices, and the
+    results are written into a preallocated (rows x windows) matrix.
+
+    ::param array prices: one-dimensional price history sorted by time
+    ::param list windows: moving average window sizes
+    ::param array out: optional preallocated float64 matrix for the results
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    N = len(prices)
+    if out is None:
+        out = np.empty((N, len(windows)), dtype=np.float64)
+    if N == 0:
+        return out
+
+    # Center the prices before the cumulative sum to limit the loss of
+    # precision when subtracting two large running totals
+    offset, csum = _centered_cumsum(prices)
+
+    rows = np.arange(1, N+1)
+    for j, w in enumerate(windows):
+
+        # Rows with a full window use the difference of the cumulative sums
+        # Earlier rows average over every available price (min_periods=1)
+        w = int(w)
+        k = min(w, N)
+        out[:k, j] = csum[1:k+1] / rows[:k]
+        out[k:, j] = (csum[k+1:] - csum[1:N-k+1]) / w
+
+    out += offset
+    return out
+
+def latest_moving_averages(prices, windows):
+    '''Calculate the moving averages for the newest price only
+
+    Matches the last row of moving_averages() while only touching the
+    trailing max(windows) prices.
+
+    ::param array prices: one-dimensional price history sorted by time
+    ::param list windows: moving average window sizes
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    N = len(prices)
+    assert N > 0, '[ERROR] Zero prices for the moving averages'
+    sizes = np.minimum(np.asarray(windows, dtype=np.int64), N)
+    csum = np.cumsum(prices[::-1][:sizes.max()])
+    return csum[sizes-1] / sizes
+
+def moving_average_search_windows(config):
+    '''List the moving average windows evaluated by the window search
+
+    Every MOV_AVG_SEARCH_STEP-th window from MIN_MOV_AVG up to MAX_MOV_AVG,
+    independent of the stored feature windows.
+
+    ::param dict config: platform configuration from config.json
+    '''
+    return list(range(int(config['MIN_MOV_AVG']), int(config['MAX_MOV_AVG']), int(config['MOV_AVG_SEARCH_STEP'])))
+
+def moving_averages_at(prices, rows, windows):
+    '''Calculate trailing moving averages at selected rows for several windows
+
+    Matches the selected rows of moving_averages() without calculating the
+    other rows. Returns a (rows x windows) matrix.
+
+    ::param array prices: one-dimensional price history sorted by time
+    ::param array rows: positions in the price history
+    ::param list windows: moving average window sizes
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(prices) == 0:
+        return np.empty((len(rows), len(windows)), dtype=np.float64)
+
+    offset, csum = _centered_cumsum(prices)
+    return _window_means(csum, rows, np.asarray(windows, dtype=np.int64)) + offset
+
+def _centered_cumsum(prices):
+    '''Cumulative sum of the prices centered on the first price, with a leading zero
+    '''
+    offset = prices[0]
+    csum = np.empty(len(prices)+1, dtype=np.float64)
+    csum[0] = 0.0
+    np.cumsum(prices - offset, out=csum[1:])
+    return offset, csum
+
+def _window_means(csum, rows, windows):
+    '''Average the centered prices ending at each row for each window
+    '''
+    ends = rows + 1
+    starts = np.maximum(ends[:, None] - windows[None, :], 0)
+    return (csum[ends][:, None] - csum[starts]) / (ends[:, None] - starts)
+
+def moving_average_search(prices, rows, targets, windows, chunk=256):
+    '''Evaluate the mean absolute error of many moving average windows at once
+
+    The moving averages at the test rows come directly from one cumulative
+    sum of the prices, so no window needs a stored feature column. The
+    windows are evaluated in chunks to bound the memory of the
+    (rows x windows) matrix. Returns the error of each window.
+
+    ::param array prices: one-dimensional price history sorted by time
+    ::param array rows: positions of the test observations in the price history
+    ::param array targets: target prices of the test observations
+    ::param list windows: moving average window sizes to evaluate
+    ::param int chunk: number of windows evaluated per matrix operation
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    rows = np.asarray(rows, dtype=np.int64)
+    windows = np.asarray(windows, dtype=np.int64)
+    assert len(prices) > 0 and len(rows) > 0, '[ERROR] Zero observations for the moving average search'
+
+    offset, csum = _centered_cumsum(prices)
+
+    # Center the targets the same way as the prices
+    targets = np.asarray(targets, dtype=np.float64)[:, None] - offset
+    errors = np.empty(len(windows), dtype=np.float64)
+    for i in range(0, len(windows), chunk):
+        means = _window_means(csum, rows, windows[i:i+chunk])
+        errors[i:i+chunk] = np.abs(means - targets).mean(axis=0)
+
+    return errors
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resident prediction service that keeps the models loaded.
+
+Every PREDICTION_POLL_SECONDS, the service checks for newly ingested candles
+and newly registered models. Coins with a newer candle are predicted again
+and a new snapshot is published for the web application. The models are
+only reloaded when the model registry changes. Errors are logged and the
+step is retried on the next poll with the previous models, and a coin that
+fails is predicted again on the next poll without blocking the others. A
+snapshot is only published once every coin and time window has predictions.
+Stop the service with SIGINT or SIGTERM.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import json
+import time
+import signal
+
+os.chdir(os.path.dirname(os.path.realpath(__file__)))
+from db_connect import db_connect
+from predictions import current_models, predict_coins, assemble_snapshot
+from snapshot import publish_snapshot
+from features.stock_spy import features_stock_spy
+con = db_connect('../data/db.sqlite')
+
+# Load the configurations
+with open('../config.json') as f:
+    config = json.load(f)
+POLL_SECONDS = float(config['PREDICTION_POLL_SECONDS'])
+
+LATEST_CANDLE = 'SELECT MAX(time) FROM prices_coinbase WHERE coin = ?'
+REGISTRY_VERSION = 'SELECT MAX(TRAINED_TIME), COUNT(*) FROM model_registry'
+INSTANCES = {COIN + '-' + w for COIN in config['SUPPORTED_COINS'].values() for w in config['SUPPORTED_WINDOWS']}
+
+stopping = False
+def stop(signum, frame):
+    global stopping
+    stopping = True
+    print('[INFO] Stopping the prediction service')
+
+signal.signal(signal.SIGINT, stop)
+signal.signal(signal.SIGTERM, stop)
+
+models = {}
+instances = {}
+predicted_candles = {}
+pending = set()
+unpublished = False
+registry_version = None
+spy_day = None
+
+while not stopping:
+    
+    # Refresh the stock market prices once per UTC day
+    DAY = int(time.time()) // 86400
+    if DAY != spy_day:
+        try:
+            features_stock_spy(con, config)
+            spy_day = DAY
+        except Exception as e:
+            print('[ERROR] Retrying the stock market refresh after an error:', repr(e))
+    
+    # Reload the models when new models are registered, and predict every coin with them
+    # The previous models are kept until the new models load without errors
+    cursor = con.cursor()
+    try:
+        cursor.execute(REGISTRY_VERSION)
+        version = cursor.fetchone()
+        if version != registry_version:
+            models = current_models(con, config, models)
+            registry_version = version
+            pending.update(config['SUPPORTED_COINS'].values())
+        
+        # Predict the coins with a newer candle than their last prediction
+        latest_candles = {}
+        for COIN in config['SUPPORTED_COINS'].values():
+            cursor.execute(LATEST_CANDLE, (COIN,))
+            latest_candles[COIN] = cursor.fetchone()[0]
+            if latest_candles[COIN] != predicted_candles.get(COIN):
+                pending.add(COIN)
+    
+    except Exception as e:
+        
+        # The database can be locked by the collector, or the models can be replaced while loading
+        print('[ERROR] Retrying the model and candle checks after an error:', repr(e))
+        latest_candles = {}
+    
+    finally:
+        cursor.close()
+    
+    # Each coin is predicted in its own transaction, so one failing coin does not block the others
+    for COIN in sorted(pending & set(latest_candles)):
+        try:
+            print('[INFO] Predicting the prices for', COIN)
+            instances.update(predict_coins(con, config, models, [COIN]))
+            predicted_candles[COIN] = latest_candles[COIN]
+            pending.discard(COIN)
+            unpublished = True
+        except Exception as e:
+            print('[ERROR] Retrying the predictions for', COIN, 'after an error:', repr(e))
+    
+    # Only publish complete snapshots, because the web application needs every instance
+    # Until then, the last published snapshot stays current
+    missing = sorted(INSTANCES - set(instances))
+    if unpublished and len(missing) > 0:
+        print('[INFO] Waiting to publish until the predictions exist for', ', '.join(missing))
+    elif unpublished:
+        try:
+            snapshot, series_buffer = assemble_snapshot(instances)
+            publish_snapshot(snapshot, series_buffer)
+            unpublished = False
+        except Exception as e:
+            print('[ERROR] Failed to publish the prediction snapshot:', repr(e))
+    
+    # Sleep in short steps so a stop signal is handled promptly
+    wake = time.monotonic() + POLL_SECONDS
+    while not stopping and time.monotonic() < wake:
+        time.sleep(min(0.5, POLL_SECONDS))
+
+# Close the database connection when finished
+con.close()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Make the price predictions and build the prediction snapshot contents.
+
+Used by predict_prices.py for one batch of predictions and by
+prediction_daemon.py, which keeps the models loaded between predictions.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+import pandas as pd
+from training_data import inference_data, feature_columns
+from moving_averages import moving_average_column_window
+from model_registry import latest_model, load_models
+from charts import chart_item, CHART_WIDTH
+from downsample import lod_pyramid, lod_select
+from series_codec import encode_series
+
+BEST_MODELS = ['RangerForestRegressor', 'MovingAverage', 'LinearRegression',
+               'Ensemble_ALL', 'Ensemble_RF_AVG', 'Ensemble_RF_LR', 'Ensemble_AVG_LR']
+
+def current_models(con, config, loaded=None):
+    '''Load the current registered models for every coin and time window
+
+    Models that are already loaded are reused unless the registry has newer
+    models for the coin and time window. Coins and time windows without
+    registered models are left out.
+
+    Returns a dictionary of (registry entry, model objects) by (COIN, WINDOW).
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param dict loaded: models from an earlier call to reuse
+    '''
+    loaded = loaded or {}
+    models = {}
+    for COIN in config['SUPPORTED_COINS'].values():
+        for w in config['SUPPORTED_WINDOWS']:
+            
+            WINDOW = int(w)
+            entry = latest_model(con, COIN, WINDOW)
+            if entry is None:
+                continue
+            
+            previous = loaded.get((COIN, WINDOW))
+            if previous is not None and previous[0]['TRAINED_TIME'] == entry['TRAINED_TIME']:
+                models[(COIN, WINDOW)] = previous
+            else:
+                print("[INFO] Loading the model objects:", entry['ARTIFACT'])
+                models[(COIN, WINDOW)] = (entry, load_models(entry))
+    
+    return models
+
+def model_windows(config, COIN, models):
+    '''List the moving average windows used by the models as features or predictions
+
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param dict models: 'mov_avg_col' and 'feature_columns' of the models
+    '''
+    columns = models.get('feature_columns', feature_columns(config, COIN)) + [models['mov_avg_col']]
+    return [w for w in map(moving_average_column_window, columns) if w is not None]
+
+def best_prediction(models, df_predict, columns):
+    '''Predict the price with the best model or ensemble
+
+    ::param dict models: 'rfr', 'lr', 'best_model', 'mov_avg_col', and 'feature_columns'
+    ::param DataFrame df_predict: feature vector from inference_data
+    ::param list columns: feature columns for models without 'feature_columns'
+    '''
+    best_model = models['best_model']
+    x_predict = df_predict[models.get('feature_columns', columns)].values.astype(np.float32)
+    
+    # Random forest prediction
+    rf_pred = float(models['rfr'].predict(x_predict)[0])
+    
+    # Linear regression prediction
+    lr_pred = float(models['lr'].predict(x_predict)[0])
+    
+    # Moving average prediction
+    avg_pred = float(df_predict[models['mov_avg_col']].iloc[0])
+    
+    # Use the predictions associated with the best model
+    assert best_model in BEST_MODELS
+    print('[INFO] Making predictions with the best model:', best_model)
+    if best_model == 'RangerForestRegressor':
+        
+        prediction = rf_pred
+    
+    elif best_model == 'MovingAverage':
+        
+        prediction = avg_pred
+        
+    elif best_model == 'LinearRegression':
+        
+        prediction = lr_pred
+        
+    elif best_model == 'Ensemble_ALL':
+        
+        prediction = (rf_pred+avg_pred+lr_pred)/3.0
+        
+    elif best_model == 'Ensemble_RF_AVG':
+        
+        prediction = (rf_pred+avg_pred)/2.0
+    
+    elif best_model == 'Ensemble_RF_LR':
+        
+        prediction = (rf_pred+lr_pred)/2.0
+        
+    elif best_model == 'Ensemble_AVG_LR':
+        
+        prediction = (avg_pred+lr_pred)/2.0
+    
+    return prediction
+
+def predict_window(con, config, COIN, WINDOW, entry, models, df_latest):
+    '''Predict and log the price for a coin and time window
+
+    Returns the statistics, the chart, and the chart series downsampling
+    levels for the prediction snapshot.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param dict entry: registry entry of the models
+    ::param dict models: model objects from the registry
+    ::param DataFrame df_latest: features of the newest observation from inference_data
+    '''
+    print('[INFO] Time window (5 minute bundles) =', WINDOW)
+    
+    # Make prediction with the latest observation closest to NOW()
+    # Each time window bundle is five minutes (300 seconds)
+    df_predict = df_latest
+    ACTUAL_EPOCH = int(df_predict['time'].values.astype('datetime64[s]').astype('int64')[0])
+    PREDICT_EPOCH = ACTUAL_EPOCH + WINDOW*300
+    actual_time = str(df_predict['time'].iloc[0])
+    actual_price = float(df_predict['price'].iloc[0])
+    predict_time = str(pd.Timestamp(PREDICT_EPOCH, unit='s'))
+    prediction = best_prediction(models, df_predict, feature_columns(config, COIN))
+    
+    # Log the latest actual price and corresponding prediction details
+    actual_price = round(actual_price,8)
+    prediction = round(prediction,8)
+    expected_change_pct = round((prediction/actual_price)-1,8)
+    expected_change = prediction-actual_price
+    expected_change = round(expected_change,8)
+    change_direction = 'up' if expected_change > 0 else 'down'
+    
+    # Times are stored as integer epoch seconds
+    cursor = con.cursor()
+    statement = 'INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?)'
+    cursor.execute(statement, (COIN, ACTUAL_EPOCH, actual_price, PREDICT_EPOCH, prediction, WINDOW))
+    cursor.close()
+    
+    print('[INFO] Making forward-looking prediction from', actual_time)
+    print('[INFO] Latest actual price =', '{:,}'.format(actual_price))
+    print('[INFO] Prediction time =', predict_time)  
+    print('[INFO] Predicted price =', '{:,}'.format(prediction))
+    print('[INFO] The price is expected to change by', str(expected_change), 'dollars in the next 24 hours')
+    
+    # The performance statistics are registered with the models
+    model_min_error = entry['MAE']
+    MAPE = entry['MAPE']
+    training_time = str(pd.Timestamp(entry['TRAINED_TIME'], unit='s'))
+    
+    # Print the performance statistics
+    print('[INFO] Model trained at', training_time)
+    print('[INFO] Mean Absolute Error (MAE) =', '${:,.4f}'.format(model_min_error))
+    print('[INFO] Mean Absolute Percentage Error (MAPE) =', '{:.2%}'.format(MAPE))
+    
+    stats = {
+            'actual_time':actual_time,
+            'actual_price':'$ {:,.4f}'.format(actual_price),
+            'prediction':'$ {:,.4f}'.format(prediction),
+            'expected_change':'$ {:,.4f}'.format(expected_change),
+            'expected_change_pct':'{:.2%}'.format(expected_change_pct),
+            'change_direction': change_direction,
+            'stats_training_time': training_time,
+            'stats_mae': '$ {:,.4f}'.format(model_min_error),
+            'stats_mape': '{:.2%}'.format(MAPE)
+            }
+    
+    # Collect predictions for the predictive performance chart
+    # Limit to the past N months
+    YEAR_EPOCH = int((pd.Timestamp.utcnow() - pd.DateOffset(months=3)).timestamp())
+    
+    statement = 'SELECT PREDICTION_TIME AS time, PREDICTION AS pred FROM predictions \
+    WHERE COIN = ? AND WINDOW = ? AND PREDICTION_TIME > ? ORDER BY PREDICTION_TIME'
+    df_preds = pd.read_sql(statement, con, params=(COIN, WINDOW, YEAR_EPOCH))
+    assert len(df_preds) > 0, '[ERROR] Collected zero predicted prices'
+    print('[INFO] Collected', '{:,}'.format(len(df_preds)), 'predicted prices for the charts')
+    
+    statement = 'SELECT time, price FROM prices_coinbase WHERE coin = ? AND time > ? ORDER BY time'
+    df_actuals = pd.read_sql(statement, con, params=(COIN, YEAR_EPOCH))
+    assert len(df_actuals) > 0, '[ERROR] Collected zero actual prices'
+    print('[INFO] Collected', '{:,}'.format(len(df_actuals)), 'actual prices for the charts')
+    
+    # Precompute the downsampling levels of both series for the chart data API
+    series = {
+            'actuals':lod_pyramid(df_actuals['time'].values, df_actuals['price'].values),
+            'predictions':lod_pyramid(df_preds['time'].values, df_preds['pred'].values),
+            }
+    
+    # Build the chart once with the level of detail for the full range
+    START_EPOCH = min(df_actuals['time'].iloc[0], df_preds['time'].iloc[0])
+    END_EPOCH = max(df_actuals['time'].iloc[-1], df_preds['time'].iloc[-1])
+    actuals_time, actuals_price = lod_select(series['actuals'], START_EPOCH, END_EPOCH, CHART_WIDTH)
+    preds_time, preds_price = lod_select(series['predictions'], START_EPOCH, END_EPOCH, CHART_WIDTH)
+    chart = chart_item(COIN, WINDOW, actuals_time, actuals_price, preds_time, preds_price)
+    
+    return {'stats':stats, 'chart':chart, 'series':series}
+
+def predict_coins(con, config, models, coins):
+    '''Predict the prices of the given coins for every time window
+
+    Returns the snapshot contents by instance, such as BTC-USD-288. The
+    predictions are logged in one transaction, so a failed call logs none.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param dict models: loaded models from current_models
+    ::param list coins: coin identifiers to predict
+    '''
+    instances = {}
+    cursor = con.cursor()
+    cursor.execute('BEGIN')
+    try:
+        for COIN in coins:
+            
+            # Compute the features for the latest observation closest to NOW()
+            # Only the trailing candles are needed, regardless of the stored history
+            # Only the moving averages used by the models of the coin are calculated
+            print('[INFO] Starting the iteration for', COIN)
+            windows = set()
+            for w in config['SUPPORTED_WINDOWS']:
+                assert (COIN, int(w)) in models, '[ERROR] No models available for ' + COIN + ' ' + w
+                windows.update(model_windows(config, COIN, models[(COIN, int(w))][1]))
+            df_latest = inference_data(con, config, COIN, windows)
+            
+            for w in config['SUPPORTED_WINDOWS']:
+                WINDOW = int(w)
+                entry, window_models = models[(COIN, WINDOW)]
+                instances[COIN + '-' + w] = predict_window(con, config, COIN, WINDOW, entry, window_models, df_latest)
+        
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+    
+    return instances
+
+def assemble_snapshot(instances):
+    '''Assemble the prediction snapshot and its binary chart series
+
+    Returns the snapshot and the series buffer for publish_snapshot.
+
+    ::param dict instances: snapshot contents by instance from predict_coins
+    '''
+    snapshot = {'stats':{}, 'charts':{}, 'series':{}}
+    series_buffer = bytearray()
+    for INSTANCE, contents in instances.items():
+        
+        snapshot['stats'][INSTANCE] = contents['stats']
+        snapshot['charts'][INSTANCE] = contents['chart']
+        
+        # The chart series levels are appended to one binary buffer
+        snapshot['series'][INSTANCE] = {}
+        for name, levels in contents['series'].items():
+            BASE = int(levels[0][0][0])
+            snapshot['series'][INSTANCE][name] = {'base':BASE, 'levels':[]}
+            for t, v in levels:
+                snapshot['series'][INSTANCE][name]['levels'].append({'offset':len(series_buffer), 'n':len(t)})
+                series_buffer += encode_series(t, v, BASE)
+    
+    return snapshot, series_buffer
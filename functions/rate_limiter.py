@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thread-safe token bucket rate limiter shared by concurrent API calls.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import time
+import threading
+
+class TokenBucket:
+    '''Token bucket that refills at a constant rate up to a burst capacity
+
+    ::param float rate: tokens added per second
+    ::param float capacity: maximum number of tokens held for bursts
+    '''
+
+    def __init__(self, rate, capacity=None):
+        assert rate > 0, '[ERROR] The token bucket rate must be positive'
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else float(rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        '''Take tokens without waiting and report whether it succeeded
+        '''
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        '''Wait until the tokens are available, then take them
+        '''
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Decide whether the models for a coin and time window need to be retrained.
+
+Each registered model records a fingerprint of the feature store it was
+trained on. The models are retrained when the stored history has changed, when
+enough new candles have arrived, or when the recent error of the logged
+predictions has drifted above the error measured at training time.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import time
+import hashlib
+from feature_store import feature_store_open
+from model_registry import latest_model
+
+# Realized error of the predictions whose target time has passed,
+# matched to the actual candle at the prediction time
+REALIZED_ERROR = '''
+SELECT AVG(ABS(p.PREDICTION - c.price)), COUNT(*)
+FROM predictions p JOIN prices_coinbase c ON c.coin = p.COIN AND c.time = p.PREDICTION_TIME
+WHERE p.COIN = ? AND p.WINDOW = ? AND p.PREDICTION_TIME >= ? AND p.PREDICTION_TIME <= ?
+'''
+
+def _history_digest(store, N):
+    '''Hash the times and prices of the first N stored rows
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(store['time'][:N])
+    digest.update(store['price'][:N])
+    return digest.hexdigest()
+
+def data_fingerprint(config, COIN):
+    '''Fingerprint the stored features of a coin for a trained model
+
+    The digest covers the rows before the last stored day, because the
+    collector refreshes the current day on every run.
+
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    '''
+    store = feature_store_open(config, COIN)
+    N = len(store['time'])
+    SETTLED = int(store['time'][:N].searchsorted(int(store['time'][-1]) // 86400 * 86400)) if N > 0 else 0
+    return {
+            'rows':N,
+            'last_time':int(store['time'][-1]) if N > 0 else None,
+            'settled_rows':SETTLED,
+            'digest':_history_digest(store, SETTLED),
+            'windows':store['windows'],
+            }
+
+def realized_error(con, COIN, WINDOW, SINCE, UNTIL):
+    '''Mean absolute error of the logged predictions with a known outcome
+
+    Returns the error and the number of matched predictions.
+
+    ::param con: connection to the platform SQLite3 database
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param int SINCE: first prediction time in epoch seconds
+    ::param int UNTIL: last prediction time in epoch seconds
+    '''
+    cursor = con.cursor()
+    cursor.execute(REALIZED_ERROR, (COIN, WINDOW, SINCE, UNTIL))
+    MAE, N = cursor.fetchone()
+    cursor.close()
+    return MAE, N
+
+def retrain_reason(con, config, COIN, WINDOW, fingerprint):
+    '''Explain why the models need to be retrained, or return None
+
+    ::param con: connection to the platform SQLite3 database
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param dict fingerprint: current data fingerprint from data_fingerprint
+    '''
+    entry = latest_model(con, COIN, WINDOW)
+    if entry is None:
+        return 'no registered models'
+    trained = entry['FINGERPRINT']
+
+    # Compare the data with the data at training time
+    if trained['windows'] != fingerprint['windows'] or trained['settled_rows'] > fingerprint['rows']:
+        return 'the feature store was rebuilt'
+    store = feature_store_open(config, COIN)
+    if _history_digest(store, trained['settled_rows']) != trained['digest']:
+        return 'the price history changed'
+    N_NEW = fingerprint['rows'] - trained['rows']
+    if N_NEW >= int(config['RETRAIN_MIN_NEW_ROWS']):
+        return '{:,} new candles'.format(N_NEW)
+
+    # Compare the recent realized error of the current models with their training error
+    UNTIL = int(time.time())
+    SINCE = max(UNTIL - int(config['DRIFT_LOOKBACK_DAYS'])*86400, entry['TRAINED_TIME'] + WINDOW*300)
+    MAE, N = realized_error(con, COIN, WINDOW, SINCE, UNTIL)
+    if N >= int(config['DRIFT_MIN_PREDICTIONS']) and MAE > entry['MAE'] * float(config['DRIFT_TOLERANCE']):
+        return 'the recent MAE {:,.6f} drifted from the trained MAE {:,.6f}'.format(MAE, entry['MAE'])
+
+    return None
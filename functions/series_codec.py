@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact binary columnar encoding for the chart series.
+
+A series block holds the times as little-endian int32 offsets in seconds
+from a base epoch, followed by the values as little-endian float32. Both
+columns are four-byte aligned, so the web application reads them as
+numpy views with np.frombuffer and the browser as typed arrays with
+decodeSeries() in static/js/series.js, without copying or parsing.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import base64
+import numpy as np
+
+TIME_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<f4')
+
+def encode_series(times, values, BASE):
+    '''Encode a series as one block of time offsets followed by values
+
+    ::param array times: epoch seconds of the series
+    ::param array values: values of the series
+    ::param int BASE: epoch seconds that the time offsets are relative to
+    '''
+    offsets = np.asarray(times, dtype='int64') - BASE
+    assert len(offsets) == 0 or (offsets.min() >= np.iinfo(TIME_DTYPE).min and offsets.max() <= np.iinfo(TIME_DTYPE).max), \
+        '[ERROR] The series times are out of range for the time offsets'
+    return offsets.astype(TIME_DTYPE).tobytes() + np.asarray(values, dtype=VALUE_DTYPE).tobytes()
+
+def decode_series(buffer, OFFSET, N):
+    '''Return the time offsets and values of a series block as read-only views
+
+    ::param buffer: bytes, memory map, or other buffer holding the block
+    ::param int OFFSET: position of the block in the buffer
+    ::param int N: number of points in the series
+    '''
+    offsets = np.frombuffer(buffer, dtype=TIME_DTYPE, count=N, offset=OFFSET)
+    values = np.frombuffer(buffer, dtype=VALUE_DTYPE, count=N, offset=OFFSET + N*TIME_DTYPE.itemsize)
+    return offsets, values
+
+def series_block(offsets, values, BASE):
+    '''Serialize a decoded series for a JSON response as a base64 block
+
+    ::param array offsets: time offsets from decode_series
+    ::param array values: values from decode_series
+    ::param int BASE: epoch seconds that the time offsets are relative to
+    '''
+    data = np.asarray(offsets, dtype=TIME_DTYPE).tobytes() + np.asarray(values, dtype=VALUE_DTYPE).tobytes()
+    return {'base':int(BASE), 'n':len(offsets), 'data':base64.b64encode(data).decode('ascii')}
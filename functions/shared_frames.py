@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Share read-only feature frames with worker processes through shared memory.
+
+A frame is copied once into a shared memory block, one column after the
+other. Workers attach to the block by name and rebuild the frame from numpy
+views, so the frame is never pickled to them. Datetime columns are stored as
+their int64 nanoseconds.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+
+def share_frame(df):
+    '''Copy a frame of numeric and datetime columns into shared memory
+
+    Returns the shared memory block, which the caller closes and unlinks
+    when the workers are finished, and the picklable frame description for
+    attach_frame.
+
+    ::param DataFrame df: frame to share
+    '''
+    N = len(df)
+    columns = []
+    OFFSET = 0
+    for col in df.columns:
+        dtype = df[col].values.dtype
+        columns.append((col, dtype.str, OFFSET))
+        OFFSET += N * dtype.itemsize
+        OFFSET += -OFFSET % 8
+
+    shm = shared_memory.SharedMemory(create=True, size=max(OFFSET, 1))
+    for col, dtype, offset in columns:
+        values = df[col].values
+        np.ndarray(N, dtype=values.dtype, buffer=shm.buf, offset=offset)[:] = values
+
+    return shm, {'name':shm.name, 'rows':N, 'columns':columns}
+
+def attach_frame(spec):
+    '''Attach to a shared frame and rebuild it from read-only views
+
+    Returns the shared memory block, which must stay open while the frame
+    is used, and the frame.
+
+    ::param dict spec: frame description from share_frame
+    '''
+    shm = shared_memory.SharedMemory(name=spec['name'])
+    data = {}
+    for col, dtype, offset in spec['columns']:
+        values = np.ndarray(spec['rows'], dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        values.flags.writeable = False
+        data[col] = values
+    return shm, pd.DataFrame(data, copy=False)
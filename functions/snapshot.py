@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Immutable, versioned prediction snapshots shared by the pipeline and the
+web application.
+
+Each prediction run publishes one snapshot file with an atomic rename, so
+readers never see a partial file. The binary chart series of a snapshot are
+published first in a companion .bin file, which readers memory map. Web
+workers keep the newest snapshot in memory and only look for a newer version
+every few seconds.
+
+@author: Dale Kube (dkube@uwalumni.com)
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import threading
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'models', 'snapshots')
+SNAPSHOT_PATTERN = re.compile(r'^snapshot-(\d+)\.json$')
+N_KEEP_SNAPSHOTS = 5
+
+def snapshot_versions():
+    '''List the published snapshot versions, oldest first
+    '''
+    if not os.path.exists(SNAPSHOT_DIR):
+        return []
+    matches = [SNAPSHOT_PATTERN.match(f) for f in os.listdir(SNAPSHOT_DIR)]
+    return sorted(int(m.group(1)) for m in matches if m)
+
+def snapshot_path(VERSION, EXT='json'):
+    return os.path.join(SNAPSHOT_DIR, 'snapshot-%d.%s' % (VERSION, EXT))
+
+def write_atomic(path, data, mode='w'):
+    '''Write a file under a temporary name and rename it into place
+    '''
+    with open(path + '.tmp', mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+def publish_snapshot(snapshot, series=b''):
+    '''Publish a new snapshot version and remove the oldest versions
+
+    The version is the publication time in milliseconds. The files are
+    written under a temporary name and renamed into place atomically, with
+    the JSON file last because it marks the version as published.
+
+    ::param dict snapshot: JSON serializable snapshot contents
+    ::param bytes series: binary chart series referenced by the snapshot
+    '''
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    VERSION = max([int(time.time()*1000)] + [v+1 for v in snapshot_versions()])
+    snapshot = dict(snapshot, version=VERSION)
+
+    write_atomic(snapshot_path(VERSION, 'bin'), bytes(series), 'wb')
+    SNAPSHOT_FILE = snapshot_path(VERSION)
+    write_atomic(SNAPSHOT_FILE, json.dumps(snapshot))
+    print('[INFO] Published the prediction snapshot', SNAPSHOT_FILE)
+
+    # Readers that already opened or mapped an old version can still finish reading it
+    for v in snapshot_versions()[:-N_KEEP_SNAPSHOTS]:
+        os.remove(snapshot_path(v))
+        if os.path.exists(snapshot_path(v, 'bin')):
+            os.remove(snapshot_path(v, 'bin'))
+
+    return VERSION
+
+class SnapshotCache:
+    '''Keep the newest prediction snapshot in memory
+
+    The optional prepare function derives the in-memory form of each new
+    snapshot once, such as prebuilt responses. The binary chart series are
+    memory mapped read-only and passed to it as snapshot['series_buffer'].
+
+    ::param float check_interval: seconds between checks for a newer version
+    ::param function prepare: transforms a newly loaded snapshot
+    '''
+
+    def __init__(self, check_interval=5, prepare=None):
+        self.check_interval = check_interval
+        self.prepare = prepare
+        self.checked = float('-inf')
+        self.version = None
+        self.snapshot = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        '''Return the newest snapshot, loading a new version when one appears
+        '''
+        if time.monotonic() - self.checked >= self.check_interval:
+            with self.lock:
+                if time.monotonic() - self.checked >= self.check_interval:
+                    versions = snapshot_versions()
+                    if len(versions) > 0 and versions[-1] != self.version:
+                        with open(snapshot_path(versions[-1])) as f:
+                            snapshot = json.load(f)
+                        SERIES_FILE = snapshot_path(versions[-1], 'bin')
+                        snapshot['series_buffer'] = b''
+                        if os.path.exists(SERIES_FILE) and os.path.getsize(SERIES_FILE) > 0:
+                            with open(SERIES_FILE, 'rb') as f:
+                                snapshot['series_buffer'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        self.snapshot = self.prepare(snapshot) if self.prepare else snapshot
+                        self.version = versions[-1]
+                    self.checked = time.monotonic()
+
+        assert self.snapshot is not None, '[ERROR] No prediction snapshot has been published'
+        return self.snapshot
@@ -1,63 +1,147 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Retrieve the full training data set for the specified coin with
-the secondary features.
+Build the training feature matrix for the specified coin with the secondary
+features, or the feature vector for the newest observation.
+
+The training features are written straight from the feature store memory
+maps into one preallocated float32 matrix, so no intermediate frames are
+built.
 
 @author: Dale Kube (dkube@uwalumni.com)
 """
 
+import numpy as np
 import pandas as pd
+from moving_averages import latest_moving_averages, moving_average_windows, moving_average_columns, moving_average_column_window
+from feature_store import feature_store_open
 
-def training_data(con, config, COIN, WINDOW, prices_spy, prices_btc, inference=False):
-    '''Prepare the training data for model training and inference
+def _daily_feature(days, prices_daily, column):
+    '''Look up a daily feature for each UTC day, or 0 for days without a value
+    '''
+    feature_days = prices_daily['time_merge'].values.astype('datetime64[s]').astype('int64')
+    values = prices_daily[column].values.astype(np.float64)
+    assert len(np.unique(feature_days)) == len(feature_days), '[ERROR] Duplicate days in the ' + column + ' feature'
     
-    Collect the historical prices and merge the prices with additional
-    data sources for feature engineering.
+    out = np.zeros(len(days), dtype=np.float64)
+    if len(feature_days) == 0:
+        return out
+    order = np.argsort(feature_days)
+    feature_days, values = feature_days[order], values[order]
+    i = np.minimum(np.searchsorted(feature_days, days), len(feature_days)-1)
+    found = feature_days[i] == days
+    out[found] = values[i[found]]
+    return np.nan_to_num(out, nan=0.0)
+
+def training_rows(config, COIN, WINDOW):
+    '''Count the stored rows of a coin that have a price target
+
+    The rows are the first N positions of the feature store, oldest first.
+
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
     '''
+    return max(0, len(feature_store_open(config, COIN)['time']) - WINDOW)
+
+def training_matrix(config, COIN, WINDOW, prices_spy, prices_btc, columns, rows):
+    '''Build the float32 feature matrix and the price targets for model training
     
-    # Load the data for the coin
-    # Print the row count when finished
-    statement = 'SELECT * FROM prices_coinbase WHERE coin = "%s"' % COIN
-    df = pd.read_sql(statement, con)
-    df['time'] = pd.to_datetime(df['time'])
-    del df['coin']
+    Each row is written once into a C-contiguous matrix in the order of the
+    given feature store positions. The target of a row is the price WINDOW
+    rows later (288 five minute periods for 24 hours). Missing SPY and BTC
+    values are 0.
     
-    N_DF = len(df)
-    assert N_DF > 0, '[ERROR] Zero rows in the collected data for ' + COIN
-    print("[INFO] Successfully read", '{:,}'.format(N_DF), "rows from the database")
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    ::param int WINDOW: time window in five minute bundles
+    ::param DataFrame prices_spy: SPY features by day from features_stock_spy
+    ::param DataFrame prices_btc: BTC features by day from features_bitcoin
+    ::param list columns: feature columns from feature_columns()
+    ::param array rows: feature store positions with a price target
+    '''
+    # Open the stored features for the coin, which train_models.py synchronizes
+    # before any training job starts
+    store = feature_store_open(config, COIN)
+    rows = np.asarray(rows, dtype=np.int64)
+    assert len(rows) > 0, '[ERROR] Zero rows in the collected data for ' + COIN
+    assert rows.max() + WINDOW < len(store['time']), '[ERROR] Training rows without a price target for ' + COIN
     
-    df['time_merge'] = df['time'].dt.strftime('%Y-%m-%d')
-    df['time_merge'] = pd.to_datetime(df['time_merge'])
+    x = np.empty((len(rows), len(columns)), dtype=np.float32)
+    days = store['time'][rows] // 86400 * 86400
+    daily = {'stock_spy_open':prices_spy, 'stock_spy_close':prices_spy, 'btc_price':prices_btc}
+    windows = {w:k for k, w in enumerate(store['windows'])}
+    for j, col in enumerate(columns):
+        
+        if col == 'price':
+            x[:, j] = store['price'][rows]
+        elif col in daily:
+            x[:, j] = _daily_feature(days, daily[col], col)
+        else:
+            x[:, j] = store['moving_averages'][rows, windows[moving_average_column_window(col)]]
     
-    # Add stock market features
-    df = df.merge(prices_spy, on=['time_merge'], how='left')
+    y = np.asarray(store['price'][rows + WINDOW], dtype=np.float64)
+    print("[INFO] Built the", '{:,}'.format(len(rows)), 'x', len(columns), 'training matrix for', COIN)
+    return x, y
+
+def feature_columns(config, COIN):
+    '''List the feature columns of the training data for a coin, in order
     
-    # Add the historical Bitcoin prices
+    ::param dict config: platform configuration from config.json
+    ::param str COIN: coin identifier, such as BTC-USD
+    '''
+    columns = ['price', 'stock_spy_open', 'stock_spy_close']
     if COIN != 'BTC-USD':
-        df = df.merge(prices_btc, on=['time_merge'], how='left')
+        columns.append('btc_price')
+    return columns + moving_average_columns(moving_average_windows(config))
+
+def inference_data(con, config, COIN, windows=None):
+    '''Prepare the features for the newest observation of a coin
+    
+    Only the trailing candles for the longest moving average and the SPY and
+    BTC values for the newest day are read, so the cost does not depend on
+    the stored history. Returns a single row with the time, the price, the
+    SPY and BTC features, and the moving averages of the given windows.
+    
+    ::param list windows: moving average windows, by default the stored feature windows
+    '''
+    if windows is None:
+        windows = moving_average_windows(config)
+    
+    # Load the trailing candles for the coin, newest first
+    N_TAIL = max(list(windows) + [1])
+    statement = 'SELECT time, price FROM prices_coinbase WHERE coin = ? ORDER BY time DESC LIMIT ?'
+    cursor = con.cursor()
+    cursor.execute(statement, (COIN, N_TAIL))
+    tail = cursor.fetchall()
+    assert len(tail) > 0, '[ERROR] Zero rows in the collected data for ' + COIN
     
-    # Finish up adding features
-    del df['time_merge']
+    LATEST_TIME = int(tail[0][0])
+    prices = [r[1] for r in tail[::-1]]
+    DAY_START = LATEST_TIME // 86400 * 86400
     
-    # Calculate rolling average features
-    df.sort_values(by=['time'], inplace=True)
-    for i in range(int(config['MIN_MOV_AVG']), int(config['MAX_MOV_AVG']), int(config['INTERVAL_MOV_AVG'])):
-        rolling_price = df['price'].rolling(window=i, min_periods=1, center=False)
-        df['MovingAverage_price_'+str(i)] = rolling_price.mean() 
+    df = pd.DataFrame({'time':[pd.Timestamp(LATEST_TIME, unit='s')], 'price':[float(prices[-1])]})
+    
+    # Add stock market features
+    statement = 'SELECT stock_spy_open, stock_spy_close FROM features_stock_spy WHERE time = ?'
+    cursor.execute(statement, (DAY_START,))
+    spy = cursor.fetchone() or (0, 0)
+    df['stock_spy_open'] = spy[0]
+    df['stock_spy_close'] = spy[1]
+    
+    # Add the maximum Bitcoin price for the day
+    if COIN != 'BTC-USD':
+        statement = 'SELECT max_price FROM daily_prices WHERE coin = "BTC-USD" AND day = ?'
+        cursor.execute(statement, (DAY_START,))
+        btc = cursor.fetchone()
+        df['btc_price'] = btc[0] if btc else None
+    cursor.close()
     
-    # Drop rows with na values and convert to float32
+    # Calculate the rolling average features for the newest price
+    windows = sorted(windows)
+    mov_avgs = latest_moving_averages(prices, windows)
+    mov_avgs = pd.DataFrame([mov_avgs], columns=moving_average_columns(windows))
+    df = pd.concat([df, mov_avgs], axis=1)
     df.fillna(0, inplace=True)
     
-    # Sort and calculate the 24 hours forward closing price (288 time periods of five minutes)
-    # 86400/300 = 288
-    # Remove observations without a 24-hour price target
-    if inference:
-        df.sort_values(by=['time'], inplace=True)
-    else:
-        df.sort_values(by=['time'], inplace=True, ascending=False)
-        df['Y_PRICE'] = df['price'].shift(WINDOW)
-        df = df[~pd.isnull(df['Y_PRICE'])]
-        del df['time']
-    
-    return df
\ No newline at end of file
+    return df
@@ -12,6 +12,7 @@ DB_FILE_PATH = './data/db.sqlite'
 assert os.path.isfile(DB_FILE_PATH), 'Database file does not exist: ' + DB_FILE_PATH
 
 # Execute sequential core functions
+call(['python3','./functions/db_create.py'])
 call(['python3','./functions/api_collect_prices_coinbase.py'])
 call(['python3','./functions/train_models.py'])
 call(['python3','./functions/predict_prices.py'])
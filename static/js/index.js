@@ -2,6 +2,31 @@
 // main JavaScript file for the web platform
 
 var page_loaded = 0;
+var chart_detail_timer = null;
+
+// Load finer chart detail for the visible time range after panning or zooming
+// Called by the chart's range callback with the Bokeh data sources to update
+function loadChartDetail(coin_code, window_int, x_range, width, actuals, predictions){
+    
+    clearTimeout(chart_detail_timer);
+    chart_detail_timer = setTimeout(function(){
+      
+      $.ajax({
+        url: "/chart_data?coin=" + coin_code + "&window=" + window_int + "&start=" + Math.floor(x_range.start) + "&end=" + Math.ceil(x_range.end) + "&width=" + width,
+        type: "GET",
+        aysnc: true,
+        contentType:"application/json",
+        success: function(data){
+          const actuals_series = decodeSeries(data.actuals);
+          const predictions_series = decodeSeries(data.predictions);
+          actuals.data = {x: actuals_series.time, y: actuals_series.price};
+          predictions.data = {x: predictions_series.time, y: predictions_series.price};
+        }
+      });
+      
+    }, 250);
+    
+}
 
 // Retrieve the price prediction for a given coin and time window
 function pricePrediction(coin, window_int){
@@ -143,14 +168,27 @@ $(document).ready(function(){
   // Emoji button clicks
   $(".emojiButton").on('click', function(){
     
-    const current_value = parseInt($(this).children('span').text());
+    const button = $(this);
     var current_coin = $("#predict_coin").attr("active-coin");
     const window_int = "288";
     
     current_coin = current_coin.split(":");
     const coin_code = current_coin[1];
-    $.get("/emoji_pump?id=" + this.id + "&window=" + window_int + "&coin=" + coin_code);
-    $(this).children('span').text(current_value + 1);
+    $.get("/emoji_pump?id=" + this.id + "&window=" + window_int + "&coin=" + coin_code)
+      .done(function(){
+        const current_value = parseInt(button.children('span').text());
+        button.children('span').text(current_value + 1);
+      })
+      .fail(function(xhr){
+        // Show that the votes are throttled until the client may vote again
+        if (xhr.status == 429 && !button.hasClass("emojiThrottled")) {
+          const title = button.attr("title");
+          button.addClass("emojiThrottled").attr("title", "Slow down! Try again in a moment.");
+          setTimeout(function(){
+            button.removeClass("emojiThrottled").attr("title", title);
+          }, 2000);
+        }
+      });
     
   })
   
@@ -0,0 +1,26 @@
+
+// Decoder for the compact chart series blocks from functions/series_codec.py
+// Each block holds little-endian int32 time offsets in seconds from the base
+// epoch, followed by little-endian float32 values
+
+function decodeSeries(block){
+    
+    const binary = atob(block.data);
+    const bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++){
+      bytes[i] = binary.charCodeAt(i);
+    }
+    
+    // Both columns are four-byte aligned, so the typed arrays are views of the buffer
+    const offsets = new Int32Array(bytes.buffer, 0, block.n);
+    const values = new Float32Array(bytes.buffer, 4*block.n, block.n);
+    
+    // Bokeh datetime axes use epoch milliseconds
+    const times = new Float64Array(block.n);
+    for (var j = 0; j < block.n; j++){
+      times[j] = (block.base + offsets[j]) * 1000;
+    }
+    
+    return {time: times, price: values};
+    
+}
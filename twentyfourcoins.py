@@ -8,16 +8,10 @@ Web application for TwentyFourCoins
 
 import os
 import json
-import time
-from flask import Flask, render_template, jsonify, request, redirect
+from flask import Flask, Response, render_template, jsonify, request, redirect
 from flask_fontawesome import FontAwesome
 
-from bokeh.plotting import figure
-from bokeh.embed import json_item
-from bokeh.models import NumeralTickFormatter, Legend, HoverTool
-
 from datetime import datetime
-import pandas as pd
 
 ## DEVELOPMENT ONLY
 ## os.chdir('/home/dale/Downloads/GitHub/TwentyFourCoins/')
@@ -38,9 +32,42 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_PERMANENT'] = False 
 
-from functions.db_connect import db_connect
+from functions.db_access import emoji_counts
+from functions.snapshot import SnapshotCache
+from functions.downsample import lod_select
+from functions.series_codec import decode_series, series_block
+from functions.emoji_writer import EmojiWriter
 emoji_map = {"emojiRocket":"E01", "emojiDeath":"E02"}
 
+def prepare_snapshot(snapshot):
+    '''Serialize the price prediction responses once for each new snapshot
+    
+    The downsampling levels of the chart series become array views of the
+    memory mapped series buffer.
+    '''
+    snapshot['responses'] = {}
+    for INSTANCE, stats in snapshot['stats'].items():
+        payload = {'stats':stats, 'charts':snapshot['charts'][INSTANCE]}
+        snapshot['responses'][INSTANCE] = json.dumps(payload).encode('utf-8')
+    
+    buffer = snapshot.pop('series_buffer')
+    for series in snapshot['series'].values():
+        for name, encoded in series.items():
+            levels = [decode_series(buffer, level['offset'], level['n']) for level in encoded['levels']]
+            series[name] = (encoded['base'], levels)
+    return snapshot
+
+# The latest prediction snapshot is kept in memory by each worker
+snapshots = SnapshotCache(prepare=prepare_snapshot)
+
+# Emoji votes are throttled per client and saved in batches
+emoji_writer = EmojiWriter(
+        flush_interval = int(config['EMOJI_FLUSH_MS'])/1000,
+        max_batch = int(config['EMOJI_FLUSH_EVENTS']),
+        client_rate = float(config['EMOJI_CLIENT_RATE']),
+        client_burst = float(config['EMOJI_CLIENT_BURST'])
+        )
+
 # Home
 @app.route('/', methods=['GET'])
 def index():
@@ -48,14 +75,11 @@ def index():
     # Retrieve the latest predictions for all supported coins
     SUPPORTED_COINS = config['SUPPORTED_COINS'].items()
     SUPPORTED_WINDOWS = config['SUPPORTED_WINDOWS']
-    COIN_STATS = {}
+    COIN_STATS = snapshots.get()['stats']
     for COIN in config['SUPPORTED_COINS'].values():
         for WINDOW in config['SUPPORTED_WINDOWS']:
             INSTANCE = COIN + '-' + WINDOW
-            JSON_PATH = 'models/' + COIN + '/' + WINDOW + '/' + 'latest.json'
-            assert os.path.exists(JSON_PATH), '[ERROR] The latest.json file does not exist for ' + COIN
-            with open(JSON_PATH) as f:
-                COIN_STATS[INSTANCE] = json.load(f)
+            assert INSTANCE in COIN_STATS, '[ERROR] The latest predictions do not exist for ' + INSTANCE
     
     UPDATE_TIME = datetime.now().astimezone().strftime('%Y-%m-%d %I:%M:%S %p %Z')
     
@@ -99,59 +123,43 @@ def price_prediction():
     COIN = response['COIN']
     WINDOW = response['WINDOW']
     
+    # Return the prebuilt statistics and chart for the latest snapshot
     try:
         
-        # Load the latest predictions and performance statistics
-        JSON_PATH = 'models/' + COIN + '/' + WINDOW + '/latest.json'
-        assert os.path.exists(JSON_PATH), '[ERROR] The latest.json file does not exist at' + JSON_PATH
-        with open(JSON_PATH) as f:
-            latest_json = json.load(f)
-        
-        # Retrieve the data for the charts
-        JSON_PATH = 'models/' + COIN + '/' + WINDOW + '/charts.json'
-        assert os.path.exists(JSON_PATH), '[ERROR] The charts.json file does not exist at' + JSON_PATH
-        with open(JSON_PATH) as f:
-            chart_data = json.load(f)
-        
-        actuals = json.loads(chart_data['actuals'])
-        actuals_time = list(actuals['time'].values())
-        actuals_values = list(actuals['price'].values())
-        df_actuals = pd.DataFrame({'time':actuals_time, 'values':actuals_values})
-        df_actuals['time'] = pd.to_datetime(df_actuals['time'])
-        
-        preds = json.loads(chart_data['predictions'])
-        preds_time = list(preds['time'].values())
-        preds_values = list(preds['pred'].values())
-        df_preds = pd.DataFrame({'time':preds_time, 'values':preds_values})
-        df_preds['time'] = pd.to_datetime(df_preds['time'])
+        payload = snapshots.get()['responses'][COIN + '-' + WINDOW]
+    
+    except:
+        return jsonify(success=False), 500
+    
+    return Response(payload, mimetype='application/json')
+
+# Collect the chart data for a time range
+@app.route('/chart_data', methods=['GET'])
+def chart_data():
+    '''Retrieve the chart series for a time range at the level of detail for the chart width
+    
+    The start and end times are epoch milliseconds, matching the Bokeh datetime axis.
+    Each series is returned as a base64 block for decodeSeries() in static/js/series.js.
+    '''
+    COIN = request.args.get('coin')
+    WINDOW = request.args.get('window')
+    START = int(float(request.args.get('start'))) // 1000
+    END = -(-int(float(request.args.get('end'))) // 1000)
+    WIDTH = min(max(int(request.args.get('width')), 1), 4000)
+    
+    try:
         
-        # Define the chart figure
-        fig = figure(x_axis_type='datetime', tools="pan,box_select,reset,wheel_zoom", active_drag="pan")
-        fig.add_layout(Legend(location=(50, 0), orientation="horizontal"), "above")
-        fig.line(df_actuals['time'], df_actuals['values'], color='#4488EE', line_width=2, legend_label='Actuals', name="Actuals")
-        fig.line(df_preds['time'], df_preds['values'], color='black', line_width=2, legend_label='Predictions', name="Predictions")
-        fig.width = 475
-        fig.height = 300
-        fig.toolbar.logo = None
-        fig.background_fill_color = None
-        fig.border_fill_color = None
-        fig.legend.background_fill_color = None
-        fig.legend.border_line_color = None
-        fig.legend.padding = 0
-        fig.legend.margin = 0
-        fig.legend.spacing = 10
-        fig.legend.label_text_font_size = '16pt'
-        fig.legend.label_text_font = 'Calibri'
-        fig.legend.label_text_color = 'black'
-        fig.yaxis[0].formatter = NumeralTickFormatter(format="$0,.00")
-        hover = HoverTool(tooltips=[("Line", "$name"),("Date", "$x{%F %T %Z}"),("Price", "$y{$0.0000}")], formatters={"$x": 'datetime'})
-        fig.add_tools(hover)
+        series = snapshots.get()['series'][COIN + '-' + WINDOW]
     
     except:
         return jsonify(success=False), 500
     
-    time.sleep(0.5)
-    return jsonify(stats=latest_json, charts=json_item(fig, 'mainChart'))
+    charts = {}
+    for name, (BASE, levels) in series.items():
+        t, v = lod_select(levels, START - BASE, END - BASE, WIDTH)
+        charts[name] = series_block(t, v, BASE)
+    
+    return jsonify(charts)
 
 @app.route('/emoji_load', methods=['GET'])
 def emoji_load():
@@ -160,19 +168,10 @@ def emoji_load():
     
     COIN = request.args.get('coin')
     WINDOW = int(request.args.get('window'))
-    con = db_connect('./data/db.sqlite')
-    
-    statement = 'SELECT UTC_TIME, EMOJI FROM emojis \
-    WHERE WINDOW = %s AND COIN="%s"' % (WINDOW, COIN)
-    df = pd.read_sql(statement, con)
-    emoji_cnts = df['EMOJI'].value_counts()
-    for v in emoji_map.values():
-        if not v in emoji_cnts.index:
-            emoji_cnts[v] = 0
+    emoji_cnts = emoji_counts(COIN, WINDOW)
     
-    ROCKET_TOTAL = int(emoji_cnts['E01'])
-    DEATH_TOTAL = int(emoji_cnts['E02'])
-    con.close()
+    ROCKET_TOTAL = int(emoji_cnts.get('E01', 0))
+    DEATH_TOTAL = int(emoji_cnts.get('E02', 0))
     
     return jsonify(totals=[ROCKET_TOTAL, DEATH_TOTAL], success=True)
 
@@ -186,15 +185,10 @@ def emoji_pump():
     WINDOW = int(request.args.get('window'))
     EMOJI = emoji_map[pump_id]
     
-    con = db_connect('./data/db.sqlite')
-    cursor = con.cursor()
-    statement = 'INSERT INTO emojis \
-    VALUES (strftime("%%Y-%%m-%%d %%H:%%M:%%S", datetime("now")), \
-    "%s", %s, "%s")' % (EMOJI, WINDOW, COIN)
-    cursor.execute(statement)    
-    cursor.close()
-    con.commit()
-    con.close()
+    # Nginx passes the client address in the X-Real-IP header
+    client = request.headers.get('X-Real-IP', request.remote_addr)
+    if not emoji_writer.submit(client, EMOJI, WINDOW, COIN):
+        return jsonify(success=False), 429
     
     return jsonify(success=True), 200
     